@@ -1,68 +1,245 @@
+import argparse
+import os
+import pandas as pd
+import cache
+import duplicate_index
 import functions as f
-import logging as logg
+import ingest
+import logger as logg
+import metrics
+import pipeline
 
 
 
 
 
-def get_data(debug: bool = False):
-    # Get data from user
-    print("Enter input:")
+def clean_data(
+    data_frame: pd.DataFrame,
+    file_type: str,
+    separators: dict[str, str | None] | None = None,
+) -> dict[str, str | None]:
+    # The steps of each file type are registered in pipeline.py
+    return pipeline.run(data_frame, file_type=file_type, separators=separators)
 
-    data_from_user = ""
-    while True:
-        input_line = input().replace("−", "-")
-        if input_line.strip().upper() == "END":
-            break
-        elif input_line.strip() != "":
-            data_from_user += input_line + "\n"
 
+def process_data(
+    data_from_user: str | bytes,
+    debug: bool = False,
+    encoding: str = "utf-8",
+    source: str = "",
+) -> dict:
     logg.create_folder_file()
+    metrics.start()
+    duplicate_index.start(keep_checked=cache.enabled())
+
+    # Input read from a file is already on disk, only pasted or piped input is copied to the log
+    text = ""
+    if not source or debug:
+        text = data_from_user if isinstance(data_from_user, str) else data_from_user.decode(encoding)
 
     logg.log_to_file(
         heading="User input",
-        data_changes=[data_from_user],
+        data_changes=[f"Read from {source}" if source else text],
     )
 
     if debug:
         print("#######\nYOUR INPUT: \n\n")
-        print(data_from_user)
+        print(text)
         print("\n#######\n")
 
+    # The same input with the same static data gives the same result
+    cache_key = cache.input_key(data_from_user, encoding) if cache.enabled() else None
+    if cache_key is not None:
+        cached = metrics.run_step(cache.load, cache_key)
+        if cached is not None:
+            duplicate_index.commit()
+            metrics.finish(file_type=cached["file_type"], rows=cached["rows"], cached=True)
+            return cached
+
+    sample = data_from_user[: 1 << 16]
+    if isinstance(sample, bytes):
+        sample = sample.decode(encoding, errors="ignore")
+
+    separator = metrics.run_step(f.get_separator, sample, debug=debug)
+    data_frame = metrics.run_step(
+        f.convert_data_to_df, separator, data_from_user, debug=debug, encoding=encoding
+    )
+    file_type = metrics.run_step(f.indentify_file_type, data_frame, debug=debug)
+    metrics.run_step(f.update_header, data=data_frame, file_type=file_type)
+    clean_data(data_frame, file_type=file_type)
+
+    output_path = metrics.run_step(logg.save_new_file, data=data_frame, file_type=file_type)
+    duplicate_index.commit()
+    metrics.finish(file_type=file_type, rows=len(data_frame))
+
+    result = {
+        "file_type": file_type,
+        "rows": len(data_frame),
+        "output": output_path,
+        "warnings": list(logg.run_warnings),
+    }
+    if cache_key is not None:
+        cache.store(cache_key, logg.file_name_prefix(data_frame, file_type), result)
+
+    return result
+
+
+def get_data(debug: bool = False, path: str | None = None):
+    # Get data from user, a file or piped stdin
+    data_from_user, encoding = ingest.read_input(path)
+    source = path if path not in (None, "-") else ""
+    process_data(data_from_user, debug=debug, encoding=encoding, source=source)
 
-    separator = f.get_separator(data_from_user, debug=debug)
-    data_frame = f.convert_data_to_df(separator, data_from_user, debug=debug)
-    file_type = f.indentify_file_type(data_frame, debug=debug)
-    f.update_header(data=data_frame, file_type=file_type)
-    f.convert_distributor(data=data_frame, file_type=file_type)
-    f.add_distributor(data=data_frame, file_type=file_type)
-    f.remove_duplicate(data=data_frame)
-    if file_type in ["RFH", "RHC", "PTOI", "PTOC"]:
-        f.pad_customer_number(data=data_frame)
-    if file_type in ["RHC", "PTOC"]:
-        f.check_valid_error_code(data=data_frame)
-
-    if file_type == "PTOI":
-        f.check_for_units_in_ptoi(data=data_frame)
-        f.move_misplaced_accountno(data=data_frame)
-        f.fix_sell_cash(data=data_frame)
-    
-    if file_type=="RHC":
-        f.remove_negative_cash(data=data_frame)
-
-    if file_type == "PTOC":
-        f.set_tax_value_per_isin(data=data_frame)
-        f.update_tax_indetifier(data=data_frame)
-        f.update_cash_identifier(data=data_frame)
-        f.set_tax_and_cash_account(data=data_frame)
-        f.move_tax_data(data=data_frame)
-        f.fix_sell_cash(data=data_frame)
-
-    if file_type in ["RHC", "PTOC", "NTO"]:
-        f.convert_to_numeric(data=data_frame, file_type=file_type)
-        # data_frame = f.group_same_fund(data=data_frame, file_type=file_type)
-
-    logg.save_new_file(data=data_frame, file_type=file_type)
-
-
-get_data(debug=False)
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Clean ASK transfer files. Without files the content is pasted after 'Enter input:'."
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="files, glob patterns or folders to process in batch mode, '-' reads one file from stdin",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of files processed in parallel in batch mode (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="read the files in chunks and write the output as it goes, for very large files",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=100_000,
+        help="rows per chunk in streaming mode (default: 100000)",
+    )
+    parser.add_argument(
+        "--no-frame-dumps",
+        action="store_true",
+        help="do not write whole DataFrames to log.txt, the changes are still in the change log",
+    )
+    parser.add_argument(
+        "--change-log",
+        choices=["jsonl", "parquet"],
+        default=None,
+        help="format of the structured change log next to log.txt (default: jsonl)",
+    )
+    parser.add_argument(
+        "--collect-conflicts",
+        action="store_true",
+        help="report every MTR with conflicting or missing distributors and continue, instead of stopping at the first",
+    )
+    parser.add_argument(
+        "--csv-engine",
+        choices=["pyarrow", "c"],
+        default=None,
+        help="parser used to read the input, 'c' is the pandas C engine (default: pyarrow)",
+    )
+    parser.add_argument(
+        "--string-dtype",
+        choices=["object", "pyarrow"],
+        default=None,
+        help="keep the text columns as Python objects or in Arrow memory, 'pyarrow' uses less memory on big files (default: object)",
+    )
+    parser.add_argument(
+        "--categorical",
+        action="store_true",
+        help="keep columns with few distinct values (distributors, MTR, ISIN, flags, ...) as categories, uses less memory",
+    )
+    parser.add_argument(
+        "--archive-compression",
+        choices=["none", "gzip", "zstd"],
+        default=None,
+        help="compress the copy of the output kept in the log folder, zstd needs the zstandard package (default: none)",
+    )
+    parser.add_argument(
+        "--validation",
+        choices=["warn", "abort", "quarantine"],
+        default=None,
+        help="what to do with values that do not match the schema of the file type: log them, stop, or move their rows to quarantine.csv (default: warn)",
+    )
+    parser.add_argument(
+        "--security-master",
+        default=None,
+        metavar="FILE",
+        help="CSV file with ISIN, VERDIPAPIRNAVN and VALUTA, used to fill blank names and currencies",
+    )
+    parser.add_argument(
+        "--cross-file-duplicates",
+        choices=["flag", "drop", "off"],
+        default=None,
+        help="warn about (flag) or remove (drop) lines delivered in an earlier file of the same type (default: flag)",
+    )
+    parser.add_argument(
+        "--group-funds",
+        action="store_true",
+        help="sum the rows of the same fund on a MTR and account into one row, for RHC and PTOC",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="process the input even if the same input was processed before",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="time each step and count rows, changed cells and peak memory, written to log.txt and metrics.json",
+    )
+    parser.add_argument(
+        "--metrics-time-only",
+        action="store_true",
+        help="as --metrics without the peak memory, measuring it makes the steps several times slower",
+    )
+    parser.add_argument("--debug", action="store_true")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Set through the environment so batch workers get the same settings
+    if args.no_frame_dumps:
+        os.environ["ASK_HELPER_DUMP_FRAMES"] = "0"
+    if args.change_log:
+        os.environ["ASK_HELPER_CHANGE_LOG"] = args.change_log
+    if args.collect_conflicts:
+        os.environ["ASK_HELPER_COLLECT_CONFLICTS"] = "1"
+    if args.csv_engine:
+        os.environ["ASK_HELPER_CSV_ENGINE"] = args.csv_engine
+    if args.string_dtype:
+        os.environ["ASK_HELPER_STRING_DTYPE"] = args.string_dtype
+    if args.categorical:
+        os.environ["ASK_HELPER_CATEGORICAL"] = "1"
+    if args.archive_compression:
+        os.environ["ASK_HELPER_ARCHIVE_COMPRESSION"] = args.archive_compression
+    if args.validation:
+        os.environ["ASK_HELPER_VALIDATION"] = args.validation
+    if args.security_master:
+        os.environ["ASK_HELPER_SECURITY_MASTER"] = os.path.abspath(args.security_master)
+    if args.cross_file_duplicates:
+        os.environ["ASK_HELPER_CROSS_FILE_DUPLICATES"] = args.cross_file_duplicates
+    if args.group_funds:
+        os.environ["ASK_HELPER_GROUP_FUNDS"] = "1"
+    if args.no_cache:
+        os.environ["ASK_HELPER_CACHE"] = "0"
+    if args.metrics or args.metrics_time_only:
+        os.environ["ASK_HELPER_METRICS"] = "time" if args.metrics_time_only else "1"
+    if args.files == ["-"]:
+        get_data(debug=args.debug, path="-")
+    elif args.files:
+        import batch
+
+        batch.run_batch(
+            args.files,
+            workers=args.workers,
+            debug=args.debug,
+            stream=args.stream,
+            chunk_size=args.chunk_size,
+        )
+    else:
+        get_data(debug=args.debug)
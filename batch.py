@@ -0,0 +1,135 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from colorama import Fore, Style
+import ask_helper
+import ingest
+import logger as logg
+import streaming
+
+
+def collect_files(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(
+                entry.path for entry in os.scandir(path) if entry.is_file()
+            )
+        elif glob.has_magic(path):
+            files += sorted(match for match in glob.glob(path) if os.path.isfile(match))
+        else:
+            files.append(path)
+
+    # Keep the order given, but process each file only once
+    return list(dict.fromkeys(files))
+
+
+def process_file(
+    path: str,
+    debug: bool = False,
+    stream: bool = False,
+    chunk_size: int = 100_000,
+) -> dict:
+    start = time.perf_counter()
+    result = {
+        "file": path,
+        "file_type": "",
+        "rows": 0,
+        "output": "",
+        "warnings": [],
+        "error": "",
+    }
+
+    try:
+        logg.start_run(os.path.splitext(os.path.basename(path))[0])
+        if stream:
+            result.update(
+                streaming.process_file_streaming(path, chunk_size=chunk_size, debug=debug)
+            )
+        else:
+            data_from_file, encoding = ingest.read_path(path)
+            result.update(
+                ask_helper.process_data(
+                    data_from_file, debug=debug, encoding=encoding, source=path
+                )
+            )
+    except Exception as error:
+        logg.close_log()
+        result["warnings"] = list(logg.run_warnings)
+        result["error"] = f"{type(error).__name__}: {error}"
+
+    result["elapsed"] = time.perf_counter() - start
+
+    return result
+
+
+def print_summary(results: list[dict]) -> None:
+    header = ["File", "Type", "Rows", "Output", "Time (s)", "Warnings"]
+    rows = [
+        [
+            os.path.basename(result["file"]),
+            result["file_type"] or "-",
+            str(result["rows"]),
+            result["output"] or result["error"],
+            f"{result['elapsed']:.2f}",
+            str(len(result["warnings"])),
+        ]
+        for result in results
+    ]
+
+    widths = [
+        max(len(row[col]) for row in rows + [header]) for col in range(len(header))
+    ]
+
+    print()
+    print("  ".join(title.ljust(width) for title, width in zip(header, widths)))
+    print("  ".join("-" * width for width in widths))
+    for result, row in zip(results, rows):
+        line = "  ".join(value.ljust(width) for value, width in zip(row, widths))
+        if result["error"]:
+            line = Fore.RED + line + Style.RESET_ALL
+        print(line)
+
+    failed = sum(1 for result in results if result["error"])
+    print(f"\n{len(results) - failed} of {len(results)} file(s) processed, {failed} failed")
+
+
+def run_batch(
+    paths: list[str],
+    workers: int | None = None,
+    debug: bool = False,
+    stream: bool = False,
+    chunk_size: int = 100_000,
+) -> list[dict]:
+    files = collect_files(paths)
+    if not files:
+        print("No files found")
+        return []
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(process_file, path, debug, stream, chunk_size): path
+            for path in files
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as error:
+                # The worker itself died, e.g. out of memory
+                results[path] = {
+                    "file": path,
+                    "file_type": "",
+                    "rows": 0,
+                    "output": "",
+                    "warnings": [],
+                    "error": f"{type(error).__name__}: {error}",
+                    "elapsed": 0.0,
+                }
+
+    ordered_results = [results[path] for path in files]
+    print_summary(ordered_results)
+
+    return ordered_results
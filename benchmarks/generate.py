@@ -0,0 +1,401 @@
+"""Generate synthetic RFH, RHC, PTOI, PTOC and NTO files with known defects.
+
+The columns come from static_data/headers.py and the distributors from
+static_data/conversion_data.py. Each defect is added at a configurable rate,
+the same seed always gives the same file.
+
+    python benchmarks/generate.py PTOC 100000 -o ptoc_100k.csv --rate duplicates=0.05
+"""
+import argparse
+import os
+import random
+import sys
+from collections.abc import Iterator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import distributor_index  # noqa: E402
+import static_data.conversion_data as conversion_data  # noqa: E402
+import static_data.headers as headers  # noqa: E402
+
+FILE_TYPES = ["RFH", "RHC", "PTOI", "PTOC", "NTO"]
+
+# Share of rows (or of the values in a row) with each defect
+DEFAULT_RATES = {
+    "unpadded_kundenr": 0.3,
+    "distributor_alias": 0.5,
+    "blank_distributor": 0.2,
+    "misplaced_account": 0.05,
+    "duplicates": 0.01,
+    "blank_flags": 0.1,
+    "mixed_decimals": 0.02,
+}
+
+FUND_HOUSES = ["DNB", "Storebrand", "Holberg", "Alfred Berg", "Delphi", "Eika", "Handelsbanken", "Nordea", "Danske Invest", "Landkreditt"]
+FUND_KINDS = ["Norge", "Global", "Norden", "Kreditt", "Obligasjon", "Likviditet", "Indeks", "Teknologi", "Utbytte", "Fremvoksende Markeder"]
+CURRENCIES = ["NOK", "NOK", "NOK", "SEK", "EUR", "USD"]
+FIRST_NAMES = ["Ola", "Kari", "Per", "Anne", "Nils", "Ingrid", "Lars", "Marit", "Jon", "Sigrid"]
+LAST_NAMES = ["Nordmann", "Hansen", "Johansen", "Olsen", "Larsen", "Berg", "Haugen", "Bakken", "Lie", "Dahl"]
+CASH_NAMES = ["Cash", "Cash", "CASH", "cash", "Cash account"]
+NTO_TYPES = ["Overføring", "Flytting"]
+ACCOUNT_OPERATORS = ["DNB Bank ASA", "Nordea Bank Abp", "SpareBank 1 SMN", "Skandinaviska Enskilda Banken"]
+
+
+def isin_check_digit(body: str) -> str:
+    # Luhn over the digits, letters count as two digits (A=10 ... Z=35)
+    digits = "".join(str(int(char, 36)) for char in body)
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit) * (2 if position % 2 == 0 else 1)
+        total += value // 10 + value % 10
+
+    return str((10 - total % 10) % 10)
+
+
+def distributor_aliases(table: dict[str, str], index: distributor_index.DistributorIndex) -> dict[str, list[str]]:
+    # Codes that are written back unchanged, with the names that convert to them
+    aliases: dict[str, list[str]] = {}
+    for name, code in table.items():
+        aliases.setdefault(code, []).append(name)
+
+    return {
+        code: names
+        for code, names in aliases.items()
+        if index.lookup.get(distributor_index.normalize_name(code), code) == code
+    }
+
+
+class FileGenerator:
+    def __init__(self, file_type: str, seed: int = 0, rates: dict[str, float] | None = None) -> None:
+        self.file_type = file_type
+        self.header = getattr(headers, f"{file_type}_header")
+        self.column = {name: position for position, name in enumerate(self.header)}
+        self.random = random.Random(seed)
+        self.rates = {**DEFAULT_RATES, **(rates or {})}
+
+        if file_type == "NTO":
+            self.aliases = distributor_aliases(conversion_data.NTO_distributors, distributor_index.NTO_distributors)
+        else:
+            self.aliases = distributor_aliases(conversion_data.distributors, distributor_index.distributors)
+        self.codes = sorted(self.aliases)
+
+        # Fund names must not start with a distributor code, move_misplaced_accountno looks for that
+        upper_codes = tuple(code.upper() for code in self.codes)
+        self.funds = []
+        while len(self.funds) < 200:
+            name = f"{self.random.choice(FUND_HOUSES)} {self.random.choice(FUND_KINDS)} {self.random.choice('ABCDE')}"
+            if name.startswith(upper_codes):
+                continue
+            body = f"{self.random.choice(['NO', 'NO', 'SE', 'LU', 'IE'])}{self.random.randrange(10**9):09d}"
+            self.funds.append((body + isin_check_digit(body), name, self.random.choice(CURRENCIES)))
+
+        self.mtr_count = 0
+        self.transfer_count = 0
+
+    def chance(self, defect: str) -> bool:
+        return self.random.random() < self.rates[defect]
+
+    def distributor(self, code: str, first: bool) -> str:
+        if not first and self.chance("blank_distributor"):
+            return ""
+        if self.chance("distributor_alias"):
+            return self.random.choice(self.aliases[code])
+        return code
+
+    def customer_number(self) -> str:
+        # Norwegian national identity number, the day is the first two digits
+        if self.chance("unpadded_kundenr"):
+            return f"{self.random.randint(1, 9)}{self.random.randrange(10**9):09d}"
+        return f"{self.random.randint(10, 31)}{self.random.randrange(10**9):09d}"
+
+    def account(self) -> str:
+        return f"{self.random.choice(['1503', '1204', '9710', '3000'])}{self.random.randrange(10**7):07d}"
+
+    def flag(self) -> str:
+        if self.chance("blank_flags"):
+            return self.random.choice(["", " "])
+        return self.random.choice(["J", "N"])
+
+    def number(self, low: float, high: float, decimals: int = 2) -> str:
+        text = f"{self.random.uniform(low, high):,.{decimals}f}".replace(",", " ")
+        if self.chance("mixed_decimals"):
+            return text
+        return text.replace(".", ",")
+
+    def transfer_ref(self) -> str:
+        self.transfer_count += 1
+        return f"TR{self.transfer_count:010d}"
+
+    def new_row(self) -> list[str]:
+        return [""] * len(self.header)
+
+    def set(self, row: list[str], **values: str) -> None:
+        for name, value in values.items():
+            row[self.column[name]] = value
+
+    def transfer(self) -> list[list[str]]:
+        # All rows of one MASTERTRANSFERREF
+        self.mtr_count += 1
+        mtr = f"MTR{self.mtr_count:09d}"
+        receiving, sending = self.random.sample(self.codes, 2)
+        holdings = self.random.sample(self.funds, self.random.randint(1, 4))
+
+        match self.file_type:
+            case "RFH":
+                rows = self.rfh_rows(holdings)
+            case "RHC":
+                rows = self.rhc_rows(holdings)
+            case "PTOI":
+                rows = self.ptoi_rows(holdings, receiving)
+            case "PTOC":
+                rows = self.ptoc_rows(holdings)
+            case "NTO":
+                return self.nto_rows(holdings, mtr, receiving, sending)
+
+        customer = self.customer_number()
+        name = f"{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}"
+        for position, row in enumerate(rows):
+            row[0] = self.distributor(receiving, position == 0)
+            row[1] = self.distributor(sending, position == 0)
+            self.set(row, KUNDENR=customer, NAVN=name)
+            row[self.column["MASTERTRANSFERREF_(FULLMAKTSNR)"]] = mtr
+
+        return rows
+
+    def rfh_rows(self, holdings: list[tuple[str, str, str]]) -> list[list[str]]:
+        account = self.account()
+        rows = []
+        for isin, name, _ in holdings:
+            row = self.new_row()
+            self.set(row, ASK_KONTO=account, ISIN=isin, VERDIPAPIRNAVN=name, ANTALL_ANDELER=self.number(1, 50_000, 4))
+            rows.append(row)
+
+        return rows
+
+    def rhc_rows(self, holdings: list[tuple[str, str, str]]) -> list[list[str]]:
+        account = self.account()
+        rows = []
+        for isin, name, currency in holdings:
+            row = self.new_row()
+            self.set(
+                row,
+                FRA_KONTO_KUNDE=account,
+                ISIN=isin,
+                VALUTA=currency,
+                VERDIPAPIRNAVN=name,
+                ANTALL_ANDELER=self.number(1, 50_000, 4),
+                VERDI=self.number(100, 2_000_000),
+                KUNDE_LEGITIMERT=self.flag(),
+                BEHOLDNING_SPERRET=self.flag(),
+            )
+            rows.append(row)
+
+        if self.random.random() < 0.5:
+            row = self.new_row()
+            self.set(row, FRA_KONTO_KUNDE=account, VALUTA="NOK", VERDIPAPIRNAVN=self.random.choice(CASH_NAMES))
+            if self.random.random() < 0.1:
+                # Overdrawn cash account, removed by remove_negative_cash
+                self.set(row, VERDI="-" + self.number(1, 5_000), FEILKODE="G")
+            else:
+                self.set(row, VERDI=self.number(0, 100_000))
+            rows.append(row)
+
+        return rows
+
+    def ptoi_rows(self, holdings: list[tuple[str, str, str]], receiving: str) -> list[list[str]]:
+        account, to_account = self.account(), self.account()
+        rows = []
+        for isin, name, currency in holdings:
+            row = self.new_row()
+            self.set(
+                row,
+                TRANSFER_REF=self.transfer_ref(),
+                ASK_KONTO_KUNDE=account,
+                TIL_ASK_KONTO_KUNDE_TILBYDER=to_account,
+                ISIN=isin,
+                VALUTA=currency,
+                VERDIPAPIRNAVN=name,
+                SELG_ALLE_ANDELER=self.flag(),
+                STOPP_SPAREAVTALE=self.flag(),
+            )
+            if self.random.random() < 0.05:
+                # Units are not expected in PTOI, removed by check_for_units_in_ptoi
+                self.set(row, ANTALL_ANDELER=self.number(1, 50_000, 4))
+            if self.chance("misplaced_account"):
+                # The nominee account written as the customer's ASK account
+                self.set(row, ISIN="", VERDIPAPIRNAVN=f"{receiving.upper()} Nominee", SELG_ALLE_ANDELER="N")
+            rows.append(row)
+
+        if self.random.random() < 0.3:
+            row = self.new_row()
+            self.set(
+                row,
+                TRANSFER_REF=self.transfer_ref(),
+                ASK_KONTO_KUNDE=account,
+                TIL_ASK_KONTO_KUNDE_TILBYDER=to_account,
+                VALUTA="NOK",
+                VERDIPAPIRNAVN=self.random.choice(CASH_NAMES),
+                SELG_ALLE_ANDELER=self.flag(),
+                STOPP_SPAREAVTALE=self.flag(),
+            )
+            rows.append(row)
+
+        return rows
+
+    def ptoc_rows(self, holdings: list[tuple[str, str, str]]) -> list[list[str]]:
+        account, to_account = self.account(), self.account()
+        date = f"{self.random.randint(1, 28):02d}.{self.random.randint(1, 12):02d}.2024"
+        rows = []
+        for isin, name, currency in holdings:
+            row = self.new_row()
+            self.set(
+                row,
+                TRANSFER_REF=self.transfer_ref(),
+                ASK_KONTO_KUNDE=account,
+                TIL_ASK_KONTO_KUNDE_TILBYDER=to_account,
+                ISIN=isin,
+                VALUTA=currency,
+                VERDIPAPIRNAVN=name,
+                SELG_ANDELER=self.flag(),
+                STOPP_SPAREAVTALE=self.flag(),
+                ANTALL_FLYTTET=self.number(1, 50_000, 4),
+                KOSTPRIS_PR_ISIN="" if self.random.random() < 0.05 else self.number(100, 1_000_000),
+                SPAREAVTALE_STOPPET=self.flag(),
+                EFFECTIVE_TRANSFER_DATE=date,
+            )
+            rows.append(row)
+
+        if self.random.random() < 0.5:
+            row = self.new_row()
+            self.set(
+                row,
+                TRANSFER_REF=self.transfer_ref(),
+                ASK_KONTO_KUNDE=account,
+                # Blank accounts on cash and tax rows are filled by set_tax_and_cash_account
+                TIL_ASK_KONTO_KUNDE_TILBYDER=self.random.choice(["", to_account]),
+                VALUTA="NOK",
+                VERDIPAPIRNAVN=self.random.choice(CASH_NAMES),
+                SELG_ANDELER=self.flag(),
+                STOPP_SPAREAVTALE=self.flag(),
+                FLYTTET_KONTANTER=self.number(0, 100_000),
+                EFFECTIVE_TRANSFER_DATE=date,
+            )
+            rows.append(row)
+
+        row = self.new_row()
+        self.set(
+            row,
+            TRANSFER_REF=self.transfer_ref(),
+            ASK_KONTO_KUNDE=account,
+            TIL_ASK_KONTO_KUNDE_TILBYDER=self.random.choice(["", to_account]),
+            VERDIPAPIRNAVN=self.random.choice(["Skatteopplysninger"] * 3 + conversion_data.tax_key),
+            SELG_ANDELER="N",
+            STOPP_SPAREAVTALE="J",
+            KOSTPRIS_PR_ISIN=self.number(1_000, 2_000_000),
+            MINSTE_INNSKUDD_HIA=self.number(0, 500_000),
+            **{
+                "UBENYTTET_SKJERMING_31.12": self.number(0, 20_000),
+                "BENYTTET_SKJERMING_HIA": self.number(0, 20_000),
+            },
+            EFFECTIVE_TRANSFER_DATE=date,
+        )
+        rows.append(row)
+
+        return rows
+
+    def nto_rows(self, holdings: list[tuple[str, str, str]], mtr: str, receiving: str, sending: str) -> list[list[str]]:
+        transfer_type = self.random.choice(NTO_TYPES)
+        from_account, to_account = self.account(), self.account()
+        from_operator, to_operator = self.random.sample(ACCOUNT_OPERATORS, 2)
+        rows = []
+        for position, (isin, name, currency) in enumerate(holdings):
+            row = self.new_row()
+            self.set(
+                row,
+                TYPE=transfer_type,
+                FRA_KONTO_EIER=self.distributor(sending, position == 0),
+                FRA_KONTO=from_account,
+                FRA_KONTOFØRER=from_operator,
+                TIL_KONTO_EIER=self.distributor(receiving, True),
+                TIL_KONTO=to_account,
+                TIL_KONTOFØRER=to_operator,
+                ISIN=isin,
+                VALUTA=currency,
+                VERDIPAPIRNAVN=name,
+                ANTALL_ANDELER=self.number(1, 50_000, 4),
+                TRANSFER_REF=self.transfer_ref(),
+            )
+            row[self.column["MASTERTRANSFERREF_(FULLMAKTSNR)"]] = mtr
+            rows.append(row)
+
+        return rows
+
+    def lines(self, rows: int, separator: str = ";") -> Iterator[str]:
+        yield separator.join(self.header) + "\n"
+        written = 0
+        previous = None
+        while written < rows:
+            for row in self.transfer():
+                if written >= rows:
+                    break
+                line = separator.join(row) + "\n"
+                if previous is not None and self.chance("duplicates"):
+                    yield previous
+                    written += 1
+                    if written >= rows:
+                        break
+                yield line
+                written += 1
+                previous = line
+
+
+def write_file(
+    path: str,
+    file_type: str,
+    rows: int,
+    seed: int = 0,
+    rates: dict[str, float] | None = None,
+    separator: str = ";",
+) -> str:
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        batch = []
+        for line in FileGenerator(file_type, seed=seed, rates=rates).lines(rows, separator):
+            batch.append(line)
+            if len(batch) >= 10_000:
+                file.write("".join(batch))
+                batch = []
+        file.write("".join(batch))
+
+    return path
+
+
+def parse_rate(text: str) -> tuple[str, float]:
+    name, _, value = text.partition("=")
+    if name not in DEFAULT_RATES:
+        raise argparse.ArgumentTypeError(f"unknown defect '{name}', use one of: {', '.join(DEFAULT_RATES)}")
+    try:
+        return name, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"rate for '{name}' must be a number, got '{value}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file_type", choices=FILE_TYPES)
+    parser.add_argument("rows", type=int)
+    parser.add_argument("-o", "--output", default=None, help="file to write (default: <file_type>_<rows>.csv)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--separator", default=";", choices=[";", "tab"])
+    parser.add_argument(
+        "--rate",
+        type=parse_rate,
+        action="append",
+        default=[],
+        metavar="DEFECT=RATE",
+        help=f"override a defect rate, defaults: {', '.join(f'{name}={rate}' for name, rate in DEFAULT_RATES.items())}",
+    )
+    args = parser.parse_args()
+
+    output = args.output or f"{args.file_type}_{args.rows}.csv"
+    write_file(output, args.file_type, args.rows, seed=args.seed, rates=dict(args.rate), separator="\t" if args.separator == "tab" else ";")
+    print(f"{args.rows} {args.file_type} rows written to {output}")
@@ -0,0 +1,126 @@
+"""Compare object and pyarrow backed string columns on one input file.
+
+Each mode is run in its own process so the peak RSS of one does not hide the
+other, with the output and logs in a temporary folder. Frame dumps are left out of log.txt unless --dump-frames is given.
+
+    python benchmarks/string_dtype.py ./big_file.csv
+"""
+import argparse
+import functools
+import importlib
+import inspect
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ["object", "pyarrow"]
+# The modules of the pipeline steps, every public function in them is timed
+STEP_MODULES = ["functions", "validation"]
+
+
+def run_mode(path: str, output_folder: str) -> dict:
+    # The output, logs and duplicate index of a benchmark do not belong in the
+    # real folders, and each mode starts from an empty one
+    try:
+        import env_data as env
+    except ImportError:
+        env = sys.modules["env_data"] = types.ModuleType("env_data")
+    env.download_folder = os.path.join(output_folder, "download", "")
+    env.log_folder = os.path.join(output_folder, "log", "")
+    os.makedirs(env.download_folder, exist_ok=True)
+    os.makedirs(env.log_folder, exist_ok=True)
+
+    import ingest
+    import logger as logg
+
+    timings = {}
+
+    def timed(name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            # setdefault keeps the steps in the order they are first called
+            timings.setdefault(name, 0.0)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - start
+
+        return wrapper
+
+    # Functions calling each other are timed inclusive of the inner calls
+    for module in map(importlib.import_module, STEP_MODULES):
+        for name, function in inspect.getmembers(module, inspect.isfunction):
+            if function.__module__ == module.__name__ and not name.startswith("_"):
+                setattr(module, name, timed(name, function))
+    logg.save_new_file = timed("save_new_file", logg.save_new_file)
+    # The pipeline registry keeps the functions it is given, so it is loaded after wrapping
+    import ask_helper
+
+    start = time.perf_counter()
+    data, encoding = timed("read_input", ingest.read_path)(path)
+    ask_helper.process_data(data, encoding=encoding, source=path)
+    total = time.perf_counter() - start
+    logg.close_log()
+
+    return {
+        "steps": timings,
+        "total": total,
+        # kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_report(results: dict[str, dict]) -> None:
+    steps = list(dict.fromkeys(step for result in results.values() for step in result["steps"]))
+    width = max(len(step) for step in steps + ["peak RSS (MB)"])
+
+    print("  ".join(["step".ljust(width)] + [mode.rjust(10) for mode in results]))
+    for step in steps:
+        row = [f"{result['steps'].get(step, 0.0):10.3f}" for result in results.values()]
+        print("  ".join([step.ljust(width)] + row))
+    print("  ".join(["total".ljust(width)] + [f"{r['total']:10.3f}" for r in results.values()]))
+    print(
+        "  ".join(
+            ["peak RSS (MB)".ljust(width)]
+            + [f"{r['peak_rss_mb']:10.1f}" for r in results.values()]
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file")
+    parser.add_argument("--dump-frames", action="store_true")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        with tempfile.TemporaryDirectory() as output_folder:
+            print(json.dumps(run_mode(args.file, output_folder)))
+        sys.exit()
+
+    results = {}
+    for mode in MODES:
+        # A cached result would time nothing
+        env = dict(os.environ, ASK_HELPER_STRING_DTYPE=mode, ASK_HELPER_CACHE="0")
+        if not args.dump_frames:
+            env["ASK_HELPER_DUMP_FRAMES"] = "0"
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), args.file, "--mode", mode],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if child.returncode != 0:
+            sys.exit(f"{mode} run failed:\n{child.stderr}")
+        results[mode] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    print_report(results)
@@ -0,0 +1,252 @@
+"""Time every function in functions.py and the full pipeline per file type and size.
+
+The input files are made by generate.py. Each file type and size is run in its
+own process, with the output and log folders in a temporary folder. The
+results are saved as JSON and can be compared with an earlier run.
+
+    python benchmarks/suite.py --sizes 1000 100000 -o before.json
+    python benchmarks/suite.py --sizes 1000 100000 -o after.json --baseline before.json
+    python benchmarks/suite.py --compare before.json after.json
+"""
+import argparse
+import functools
+import inspect
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+from colorama import Fore, Style
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+SETTINGS = [
+    "ASK_HELPER_DUMP_FRAMES",
+    "ASK_HELPER_CHANGE_LOG",
+    "ASK_HELPER_COLLECT_CONFLICTS",
+    "ASK_HELPER_CSV_ENGINE",
+    "ASK_HELPER_STRING_DTYPE",
+    "ASK_HELPER_ARCHIVE_COMPRESSION",
+    "ASK_HELPER_CROSS_FILE_DUPLICATES",
+    "ASK_HELPER_GROUP_FUNDS",
+    "ASK_HELPER_CATEGORICAL",
+    "ASK_HELPER_VALIDATION",
+    "ASK_HELPER_SECURITY_MASTER",
+]
+
+
+def run_file(path: str, output_folder: str) -> dict:
+    # The output and logs of a benchmark do not belong in the real folders
+    try:
+        import env_data as env
+    except ImportError:
+        env = sys.modules["env_data"] = types.ModuleType("env_data")
+    env.download_folder = os.path.join(output_folder, "download", "")
+    env.log_folder = os.path.join(output_folder, "log", "")
+    os.makedirs(env.download_folder, exist_ok=True)
+    os.makedirs(env.log_folder, exist_ok=True)
+
+    import functions as f
+    import ingest
+    import logger as logg
+
+    timings: dict[str, float] = {}
+    calls: dict[str, int] = {}
+
+    def timed(name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+                calls[name] = calls.get(name, 0) + 1
+
+        return wrapper
+
+    # Functions calling each other are timed inclusive of the inner calls
+    for name, function in inspect.getmembers(f, inspect.isfunction):
+        if function.__module__ == f.__name__ and not name.startswith("_"):
+            setattr(f, name, timed(name, function))
+    ingest.read_input = timed("read_input", ingest.read_input)
+    logg.save_new_file = timed("save_new_file", logg.save_new_file)
+    # The pipeline registry keeps the functions it is given, so it is loaded after wrapping
+    import ask_helper
+
+    start = time.perf_counter()
+    ask_helper.get_data(path=path)
+    total = time.perf_counter() - start
+    logg.close_log()
+
+    return {
+        "seconds": total,
+        "steps": timings,
+        "calls": calls,
+        # kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "warnings": len(logg.run_warnings),
+    }
+
+
+def run_child(path: str, output_folder: str, dump_frames: bool) -> dict:
+    env = dict(os.environ)
+    if not dump_frames:
+        env["ASK_HELPER_DUMP_FRAMES"] = "0"
+    child = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", path, output_folder],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if child.returncode != 0:
+        raise Exception(f"{os.path.basename(path)} failed:\n{child.stderr}")
+
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_suite(
+    file_types: list[str],
+    sizes: list[int],
+    repeat: int = 1,
+    seed: int = 0,
+    data_folder: str | None = None,
+    dump_frames: bool = False,
+) -> dict:
+    import pandas as pd
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ask_helper_bench_") as temp_folder:
+        data_folder = data_folder or os.path.join(temp_folder, "data")
+        os.makedirs(data_folder, exist_ok=True)
+
+        for file_type in file_types:
+            for size in sizes:
+                # Generated files are reused when a data folder is given
+                path = os.path.join(data_folder, f"{file_type}_{size}_{seed}.csv")
+                if not os.path.exists(path):
+                    generate.write_file(path, file_type, size, seed=seed)
+
+                # The fastest of the repeats, per step and in total
+                best = None
+                for attempt in range(repeat):
+                    run = run_child(path, os.path.join(temp_folder, f"run_{file_type}_{size}_{attempt}"), dump_frames)
+                    if best is None:
+                        best = run
+                        continue
+                    best["seconds"] = min(best["seconds"], run["seconds"])
+                    best["peak_rss_mb"] = min(best["peak_rss_mb"], run["peak_rss_mb"])
+                    for step, seconds in run["steps"].items():
+                        best["steps"][step] = min(best["steps"].get(step, seconds), seconds)
+
+                results.append({"file_type": file_type, "rows": size, **best})
+                print(f"{file_type:5} {size:>9} rows {best['seconds']:9.3f}s {best['peak_rss_mb']:8.1f} MB")
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "repeat": repeat,
+        "settings": {name: os.environ[name] for name in SETTINGS if name in os.environ},
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float = 10.0, min_seconds: float = 0.05) -> list[str]:
+    # A step is a regression when it is more than threshold percent and
+    # min_seconds slower, so very short steps do not count as noise
+    regressions = []
+    if old.get("settings") != new.get("settings"):
+        print(Fore.RED + f"!!! - The runs used different settings: {old.get('settings')} and {new.get('settings')}" + Style.RESET_ALL)
+    old_results = {(result["file_type"], result["rows"]): result for result in old["results"]}
+    print(f"{'file':5} {'rows':>9}  {'step':32} {'old':>9} {'new':>9} {'change':>8}")
+    for result in new["results"]:
+        key = (result["file_type"], result["rows"])
+        if key not in old_results:
+            continue
+        old_result = old_results[key]
+        steps = [("total", old_result["seconds"], result["seconds"])] + [
+            (step, old_result["steps"][step], seconds)
+            for step, seconds in sorted(result["steps"].items())
+            if step in old_result["steps"]
+        ]
+        for step, old_seconds, new_seconds in steps:
+            change = (new_seconds - old_seconds) / old_seconds * 100 if old_seconds else 0.0
+            regression = change > threshold and new_seconds - old_seconds > min_seconds
+            line = f"{key[0]:5} {key[1]:>9}  {step:32} {old_seconds:9.3f} {new_seconds:9.3f} {change:+7.1f}%"
+            if regression:
+                regressions.append(f"{key[0]} {key[1]} rows {step}: {old_seconds:.3f}s -> {new_seconds:.3f}s ({change:+.1f}%)")
+                line += "  REGRESSION"
+            print(line)
+
+    return regressions
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--types", nargs="+", choices=generate.FILE_TYPES, default=generate.FILE_TYPES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="rows per file (default: 1000 10000 100000)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per file, the fastest is kept (default: 1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", default=None, help="folder to keep the generated files in and reuse them from")
+    parser.add_argument("--dump-frames", action="store_true", help="write the DataFrame dumps to log.txt as a normal run does")
+    parser.add_argument("-o", "--output", default=None, help="results file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--baseline", default=None, help="results file to compare this run with")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="only compare two results files")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent slower counted as a regression (default: 10)")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.child:
+        print(json.dumps(run_file(*args.child)))
+        sys.exit()
+
+    if args.compare:
+        old, new = load(args.compare[0]), load(args.compare[1])
+    else:
+        new = run_suite(args.types, args.sizes, repeat=args.repeat, seed=args.seed, data_folder=args.data, dump_frames=args.dump_frames)
+        output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{datetime.now():%Y%m%d_%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(new, file, indent=2)
+        print(f"Results saved to {output}")
+        if not args.baseline:
+            sys.exit()
+        old = load(args.baseline)
+
+    regressions = compare(old, new, threshold=args.threshold)
+    for regression in regressions:
+        print(Fore.RED + f"!!! - Regression: {regression}" + Style.RESET_ALL)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import pandas as pd
+import env_data as env
+import static_data.conversion_data as conversion_data
+import static_data.headers as headers
+import static_data.schema as schema
+import duplicate_index
+import functions as f
+import logger as logg
+import security_master
+
+
+CACHE_VERSION = "1"
+# The code deciding the output, a cached result is only used with the same code
+CODE_FILES = ["functions.py", "pipeline.py", "distributor_index.py", "duplicate_index.py", "validation.py", "security_master.py", "logger.py"]
+# Settings that change the output files or the logs
+SETTINGS = [
+    "ASK_HELPER_COLLECT_CONFLICTS",
+    "ASK_HELPER_CHANGE_LOG",
+    "ASK_HELPER_ARCHIVE_COMPRESSION",
+    "ASK_HELPER_DUMP_FRAMES",
+    "ASK_HELPER_CROSS_FILE_DUPLICATES",
+    "ASK_HELPER_GROUP_FUNDS",
+    "ASK_HELPER_CATEGORICAL",
+    "ASK_HELPER_VALIDATION",
+]
+# Files next to log.txt kept with the result
+CHANGE_LOGS = ["changes.jsonl", "changes.parquet", "quarantine.csv"]
+# Fingerprints and keys of the lines checked against the earlier deliveries
+CHECKED_LINES = "checked_lines.parquet"
+
+
+def enabled() -> bool:
+    # Set ASK_HELPER_CACHE=0 to always process the input. When lines delivered
+    # before are dropped the output depends on the earlier files, not only the input
+    return (
+        os.environ.get("ASK_HELPER_CACHE", "1") != "0"
+        and duplicate_index.mode() != "drop"
+    )
+
+
+def max_size() -> int:
+    # Least recently used results are removed above this size, default 512 MB
+    return int(float(os.environ.get("ASK_HELPER_CACHE_SIZE_MB", "512")) * 2**20)
+
+
+def cache_folder() -> str:
+    return f"{env.log_folder}.cache/"
+
+
+def _static_data_version() -> str:
+    # The tables as loaded, so a changed conversion_data or headers gives new keys
+    digest = hashlib.sha256(CACHE_VERSION.encode("utf-8"))
+    for module in (conversion_data, headers, schema):
+        tables = {name: value for name, value in vars(module).items() if not name.startswith("_")}
+        digest.update(repr(sorted(tables.items())).encode("utf-8"))
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE_FILES:
+        with open(os.path.join(root, name), "rb") as file:
+            digest.update(name.encode("utf-8") + b"\0" + file.read())
+
+    return digest.hexdigest()
+
+
+STATIC_DATA_VERSION = _static_data_version()
+
+
+def input_key(data: str | bytes, encoding: str) -> str:
+    digest = hashlib.sha256(STATIC_DATA_VERSION.encode("utf-8"))
+    settings = {name: os.environ.get(name, "") for name in SETTINGS}
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    # The security master file the blank names and currencies are filled from
+    digest.update(security_master.version().encode("utf-8") + b"\0")
+    digest.update(encoding.encode("utf-8") + b"\0")
+    digest.update(data.encode("utf-8") if isinstance(data, str) else data)
+
+    return digest.hexdigest()
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def load(key: str) -> dict | None:
+    # The cached output and change log are written as a new run
+    folder = f"{cache_folder()}{key}/"
+    try:
+        with open(f"{folder}meta.json", encoding="utf-8") as file:
+            meta = json.load(file)
+        output = _read(f"{folder}output.txt")
+        archive = _read(f"{folder}archive")
+        log_text = _read(f"{folder}log.txt").decode("utf-8", errors="replace")
+        change_logs = {name: _read(f"{folder}{name}") for name in meta["change_logs"]}
+        checked = pd.read_parquet(f"{folder}{CHECKED_LINES}") if meta["checked_lines"] else None
+        # Last used time for the eviction
+        os.utime(f"{folder}meta.json")
+    except (OSError, ValueError, KeyError, ImportError):
+        return None
+
+    logg.log_to_file(
+        heading="RESULT CACHE",
+        data_changes=[f"Same input as run {meta['run']}, the output and change log are taken from it"],
+    )
+    for name, content in change_logs.items():
+        with open(f"{env.log_folder}{logg.temp_folder_name}/{name}", "wb") as file:
+            file.write(content)
+    logg.log_to_file(heading="CACHED LOG", data_changes=[log_text])
+    for warning in meta["warnings"]:
+        logg.print_warning(warning)
+    # Lines delivered before depend on the files sent since, so they are
+    # checked again and added to the index when the output is saved
+    if checked is not None and duplicate_index.mode() != "off":
+        file_type = checked["file_type"].iloc[0]
+        f.report_earlier_delivered(
+            file_type,
+            checked["fingerprint"].to_numpy(),
+            checked.drop(columns=["file_type", "fingerprint"]),
+            duplicate_index.mode(),
+        )
+
+    output_path = logg.save_cached_output(meta["prefix"], output, archive, meta["archive_suffix"])
+
+    return {
+        "file_type": meta["file_type"],
+        "rows": meta["rows"],
+        "output": output_path,
+        "warnings": list(logg.run_warnings),
+        "cached": True,
+    }
+
+
+def store(key: str, prefix: str, result: dict) -> None:
+    try:
+        _store(key, prefix, result)
+        evict()
+    except OSError as error:
+        logg.print_warning(f"Could not save the result to the cache: {error}")
+
+
+def _store(key: str, prefix: str, result: dict) -> None:
+    logg.close_log()
+    file_name = logg.temp_folder_name
+    run_folder = f"{env.log_folder}{file_name}/"
+    archive_name = next(name for name in os.listdir(run_folder) if name.startswith(f"{file_name}.csv"))
+    files = {
+        "output.txt": result["output"],
+        "archive": f"{run_folder}{archive_name}",
+        "log.txt": f"{run_folder}log.txt",
+    }
+    change_logs = [name for name in CHANGE_LOGS if os.path.exists(f"{run_folder}{name}")]
+    files.update({name: f"{run_folder}{name}" for name in change_logs})
+
+    size = sum(os.path.getsize(path) for path in files.values())
+    if size > max_size():
+        return
+
+    os.makedirs(cache_folder(), exist_ok=True)
+    temp_folder = tempfile.mkdtemp(dir=cache_folder(), prefix=".tmp_")
+    try:
+        for name, path in files.items():
+            shutil.copyfile(path, os.path.join(temp_folder, name))
+        checked = duplicate_index.checked_lines()
+        if checked is not None:
+            checked.to_parquet(os.path.join(temp_folder, CHECKED_LINES))
+            size += os.path.getsize(os.path.join(temp_folder, CHECKED_LINES))
+        meta = {
+            "run": file_name,
+            "prefix": prefix,
+            "archive_suffix": archive_name[len(file_name):],
+            "file_type": result["file_type"],
+            "rows": result["rows"],
+            # The warnings about lines delivered before are made again on a hit
+            "warnings": [warning for warning in result["warnings"] if warning not in duplicate_index.reported],
+            "change_logs": change_logs,
+            "checked_lines": checked is not None,
+            "size": size,
+            "created": time.time(),
+        }
+        with open(os.path.join(temp_folder, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        # Another process may have stored the same input in the meantime
+        os.rename(temp_folder, f"{cache_folder()}{key}")
+    except OSError:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        if not os.path.isdir(f"{cache_folder()}{key}"):
+            raise
+
+
+def evict() -> None:
+    entries = []
+    with os.scandir(cache_folder()) as folders:
+        for folder in folders:
+            if folder.name.startswith("."):
+                continue
+            try:
+                meta_path = os.path.join(folder.path, "meta.json")
+                with open(meta_path, encoding="utf-8") as file:
+                    size = json.load(file)["size"]
+                entries.append((os.stat(meta_path).st_mtime, size, folder.path))
+            except (OSError, ValueError, KeyError):
+                continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size():
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
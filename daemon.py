@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from colorama import Fore, Style
+
+# The client only needs the socket, pandas and the pipeline are loaded by "serve"
+
+
+def _user_temp_folder() -> str:
+    return os.path.join(tempfile.gettempdir(), f"ask_helper-{os.getuid()}")
+
+
+def _default_socket() -> str:
+    # In a folder only the user can open, the temp folder is shared with other users
+    folder = os.environ.get("XDG_RUNTIME_DIR") or _user_temp_folder()
+    return os.path.join(folder, "ask_helper.sock")
+
+
+DEFAULT_SOCKET = os.environ.get("ASK_HELPER_SOCKET") or _default_socket()
+
+
+def _warm_up() -> None:
+    # Runs once in each worker, the imports are cached for the jobs after it
+    import batch  # noqa: F401
+
+
+def _pool_context():
+    # Workers are started from a fork server that has only loaded the pipeline.
+    # A pool made again after a worker died would otherwise be forked from a
+    # request thread, copying locks the other threads may hold
+    import multiprocessing
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["batch"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line.strip():
+            # A connection without a request, e.g. a check for a running daemon
+            return
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            self._reply({"error": f"Invalid request: {error}"})
+            return
+
+        if request.get("command") == "stop":
+            self._reply({"stopping": True})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+
+        self._reply(self.server.run_job(request))
+
+    def _reply(self, response: dict) -> None:
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, workers: int | None) -> None:
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.workers = workers or os.cpu_count() or 1
+        self.pool_lock = threading.Lock()
+        context = _pool_context()
+        self.new_pool = lambda: ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context, initializer=_warm_up
+        )
+        self.pool = self.new_pool()
+        # Start every worker now, before the server threads exist
+        for warm_up in [self.pool.submit(_warm_up) for _ in range(self.workers)]:
+            warm_up.result()
+
+        # Jobs run with the rights of the user, so no one else may connect. The
+        # socket is made readable by the user only, there is no time between
+        # bind and a chmod where others can connect
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, JobHandler)
+        finally:
+            os.umask(umask)
+
+    def run_job(self, request: dict) -> dict:
+        from concurrent.futures.process import BrokenProcessPool
+        import batch
+
+        path = request.get("file", "")
+        with self.pool_lock:
+            pool = self.pool
+        try:
+            return pool.submit(
+                batch.process_file,
+                path,
+                bool(request.get("debug", False)),
+                bool(request.get("stream", False)),
+                int(request.get("chunk_size", 100_000)),
+            ).result()
+        except BrokenProcessPool as error:
+            # A worker died, e.g. out of memory. Later jobs get a new pool, made
+            # once by the first job that sees this pool fail
+            with self.pool_lock:
+                if self.pool is pool:
+                    self.pool = self.new_pool()
+                    pool.shutdown(wait=False)
+            return {"file": path, "error": f"{type(error).__name__}: {error}"}
+
+
+def _private_folder(folder: str) -> None:
+    # Made for the user if missing. The folder in the shared temp folder is
+    # not used when another user made it first
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    if folder == _user_temp_folder():
+        info = os.stat(folder)
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise Exception(f"The socket folder {folder} can be opened by other users, use --socket")
+
+
+def _remove_stale_socket(path: str) -> None:
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(path)
+            return
+
+    raise Exception(f"A daemon is already running on {path}")
+
+
+def serve(path: str, workers: int | None = None) -> None:
+    import batch  # noqa: F401
+
+    _private_folder(os.path.dirname(os.path.abspath(path)))
+    _remove_stale_socket(path)
+    server = JobServer(path, workers)
+    print(f"ask_helper daemon listening on {path} with {server.workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.shutdown(cancel_futures=True)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def send(path: str, request: dict) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            raise Exception(f"No daemon running on {path}, start it with: python daemon.py serve")
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with client.makefile("rb") as reply:
+            return json.loads(reply.readline())
+
+
+def submit(
+    path: str,
+    files: list[str],
+    stream: bool = False,
+    chunk_size: int = 100_000,
+    debug: bool = False,
+) -> int:
+    # One connection per file, the daemon runs them on its worker pool
+    results: dict[str, dict] = {}
+
+    def run(file: str) -> None:
+        request = {"file": os.path.abspath(file), "stream": stream, "chunk_size": chunk_size, "debug": debug}
+        try:
+            results[file] = send(path, request)
+        except Exception as error:
+            results[file] = {"file": file, "error": str(error)}
+
+    threads = [threading.Thread(target=run, args=(file,)) for file in files]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failed = 0
+    for file in files:
+        result = results[file]
+        if result.get("error"):
+            failed += 1
+            print(Fore.RED + f"{file}: {result['error']}" + Style.RESET_ALL)
+        else:
+            print(f"File saved to {result['output']}")
+        for warning in result.get("warnings", []):
+            print(Fore.RED + "!!! - " + warning + Style.RESET_ALL)
+
+    return 1 if failed else 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Keep ask_helper loaded in a background process and send files to it over a Unix socket."
+    )
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"socket path (default: {DEFAULT_SOCKET})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="start the daemon")
+    serve_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of files processed in parallel (default: number of CPUs)",
+    )
+
+    submit_parser = commands.add_parser("submit", help="process files with a running daemon")
+    submit_parser.add_argument("files", nargs="+")
+    submit_parser.add_argument("--stream", action="store_true")
+    submit_parser.add_argument("--chunk-size", type=int, default=100_000)
+    submit_parser.add_argument("--debug", action="store_true")
+
+    commands.add_parser("stop", help="stop a running daemon")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "serve":
+        serve(args.socket, workers=args.workers)
+    elif args.command == "submit":
+        sys.exit(
+            submit(
+                args.socket,
+                args.files,
+                stream=args.stream,
+                chunk_size=args.chunk_size,
+                debug=args.debug,
+            )
+        )
+    else:
+        send(args.socket, {"command": "stop"})
+        print("Daemon stopped")
@@ -0,0 +1,75 @@
+import unicodedata
+import numpy as np
+import pandas as pd
+import static_data.conversion_data as conversion_data
+
+
+def repair_mojibake(name: str) -> str:
+    # UTF-8 read as cp1252/latin-1, e.g. "SÃ¶derberg" -> "Söderberg"
+    for encoding in ("cp1252", "latin-1"):
+        try:
+            return name.encode(encoding).decode("utf-8")
+        except UnicodeError:
+            continue
+
+    return name
+
+
+def normalize_name(name: str) -> str:
+    name = unicodedata.normalize("NFKC", repair_mojibake(name)).casefold()
+    return " ".join(name.split())
+
+
+def trigrams(name: str) -> set[str]:
+    padded = f"  {name} "
+    return {padded[index : index + 3] for index in range(len(padded) - 2)}
+
+
+class DistributorIndex:
+    def __init__(self, table: dict[str, str]) -> None:
+        self.lookup: dict[str, str] = {}
+        self.names: dict[str, str] = {}
+        for name, code in table.items():
+            key = normalize_name(name)
+            if key not in self.lookup:
+                self.lookup[key] = code
+                self.names[key] = name
+
+        self.codes = {normalize_name(code) for code in table.values()}
+        self.trigrams = {key: trigrams(key) for key in self.lookup}
+
+    def convert(self, values: pd.Series) -> pd.Series:
+        # Look up each distinct value once and map the result onto the column,
+        # keeping the dtype of the column
+        codes, uniques = pd.factorize(values)
+        converted = np.array(
+            [self.lookup.get(normalize_name(str(value))) for value in uniques.to_numpy()] + [None],
+            dtype=object,
+        )
+        # The converted names are not categories of a categorical column
+        dtype = object if isinstance(values.dtype, pd.CategoricalDtype) else values.dtype
+        return pd.Series(converted[codes], index=values.index, dtype=dtype)
+
+    def is_known(self, name: str) -> bool:
+        key = normalize_name(name)
+        return key == "" or key in self.lookup or key in self.codes
+
+    def suggest(self, name: str, min_similarity: float = 0.3) -> tuple[str, str] | None:
+        name_trigrams = trigrams(normalize_name(name))
+        best_key = None
+        best_similarity = min_similarity
+        for key, key_trigrams in self.trigrams.items():
+            similarity = len(name_trigrams & key_trigrams) / len(name_trigrams | key_trigrams)
+            if similarity >= best_similarity:
+                best_key = key
+                best_similarity = similarity
+
+        if best_key is None:
+            return None
+
+        return self.names[best_key], self.lookup[best_key]
+
+
+# Built once when the module is loaded
+distributors = DistributorIndex(conversion_data.distributors)
+NTO_distributors = DistributorIndex(conversion_data.NTO_distributors)
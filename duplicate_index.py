@@ -0,0 +1,150 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+import numpy as np
+import pandas as pd
+import env_data as env
+import static_data.conversion_data as conversion_data
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, the index is then used without a lock
+    fcntl = None
+
+
+# One record per line delivered, appended to the file of the file type
+RECORD = np.dtype([("fingerprint", "<u8"), ("time", "<i8")])
+
+# Fingerprints of this run, added to the index when the output is saved
+_pending: dict[str, list[np.ndarray]] = {}
+# file type -> first delivered time per fingerprint, loaded once per run
+_loaded: dict[str, pd.Series] = {}
+# Fingerprints and key values of the lines checked in this run, kept with a
+# cached result so a file sent again is checked again
+_checked: list[pd.DataFrame] = []
+_keep_checked = False
+# Warnings about lines delivered before, not repeated from a cached result
+reported: list[str] = []
+
+
+def mode() -> str:
+    # "flag" (default) warns about lines delivered in an earlier file, "drop"
+    # also removes them and "off" does not use the index
+    return os.environ.get("ASK_HELPER_CROSS_FILE_DUPLICATES", "flag").lower()
+
+
+def retention_days() -> float:
+    # Lines delivered longer ago than this are forgotten, default 90 days
+    return float(os.environ.get("ASK_HELPER_DUPLICATE_RETENTION_DAYS", "90"))
+
+
+def index_path(file_type: str) -> str:
+    return f"{env.log_folder}.duplicate_index/{file_type}.bin"
+
+
+@contextmanager
+def _locked(path: str) -> Iterator[None]:
+    # Batch workers and the daemon may use the index at the same time
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def fingerprints(data: pd.DataFrame, file_type: str) -> tuple[np.ndarray, np.ndarray]:
+    # A 64 bit hash of the key columns per row, and which rows have a key at all
+    keys = data[conversion_data.duplicate_keys[file_type]]
+    has_key = (keys != "").any(axis=1).to_numpy()
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+    return hashes, has_key
+
+
+def start(keep_checked: bool = False) -> None:
+    # keep_checked when the result is cached, not for files read in chunks
+    global _keep_checked
+    _keep_checked = keep_checked
+    _pending.clear()
+    _loaded.clear()
+    _checked.clear()
+    reported.clear()
+
+
+def checked(file_type: str, hashes: np.ndarray, keys: pd.DataFrame) -> None:
+    if not _keep_checked:
+        return
+    frame = keys.astype(str)
+    frame.insert(0, "fingerprint", hashes)
+    frame.insert(0, "file_type", file_type)
+    _checked.append(frame)
+
+
+def checked_lines() -> pd.DataFrame | None:
+    # One row per line checked, indexed by the row of the input
+    if not _checked:
+        return None
+    return pd.concat(_checked)
+
+
+def _read(file_type: str) -> pd.Series:
+    path = index_path(file_type)
+    if not os.path.exists(path):
+        return pd.Series(np.empty(0, dtype="<i8"), index=pd.Index(np.empty(0, dtype="<u8")))
+
+    with _locked(path):
+        records = np.fromfile(path, dtype=RECORD)
+        live = records[records["time"] >= time.time() - retention_days() * 86400]
+        # The file is only appended to, expired lines are removed when they are
+        # more than half of it
+        if len(records) - len(live) > max(len(live), 1000):
+            temp_path = f"{path}.tmp"
+            live.tofile(temp_path)
+            os.replace(temp_path, path)
+
+    delivered = pd.Series(live["time"], index=pd.Index(live["fingerprint"]))
+    return delivered[~delivered.index.duplicated(keep="first")]
+
+
+def delivered_before(file_type: str, hashes: np.ndarray) -> np.ndarray:
+    # Time first delivered per row, 0 for lines not in the index
+    if file_type not in _loaded:
+        _loaded[file_type] = _read(file_type)
+    delivered = _loaded[file_type]
+    if delivered.empty:
+        return np.zeros(len(hashes), dtype="<i8")
+
+    positions = delivered.index.get_indexer(hashes)
+    times = delivered.to_numpy()[positions]
+    times[positions == -1] = 0
+
+    return times
+
+
+def add(file_type: str, hashes: np.ndarray) -> None:
+    _pending.setdefault(file_type, []).append(hashes)
+
+
+def commit() -> None:
+    # Called when the output is saved, a run that fails does not mark its lines as delivered
+    now = int(time.time())
+    for file_type, parts in _pending.items():
+        hashes = np.unique(np.concatenate(parts))
+        if len(hashes) == 0:
+            continue
+        records = np.empty(len(hashes), dtype=RECORD)
+        records["fingerprint"] = hashes
+        records["time"] = now
+
+        path = index_path(file_type)
+        with _locked(path):
+            with open(path, "ab") as file:
+                file.write(records.tobytes())
+
+    _pending.clear()
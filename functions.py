@@ -1,9 +1,18 @@
+import csv
+import os
+import re
+from datetime import datetime
+from typing import Callable, NamedTuple
+import numpy as np
 import pandas as pd
-from io import StringIO
-from colorama import Fore, Style
+from io import BytesIO, StringIO
 import static_data.headers as headers
 import static_data.conversion_data as conversion_data
-import logging as logg
+import static_data.schema as schema
+import distributor_index
+import duplicate_index
+import security_master
+import logger as logg
 
 pd.set_option("display.max_rows", None)
 pd.set_option("display.max_columns", None)
@@ -11,47 +20,220 @@ pd.set_option("display.width", None)
 pd.set_option("display.max_colwidth", None)
 
 
-def get_separator(ask_data: str, debug: bool) -> str:
-    first_line = ask_data.split("\n")[0]
+SEPARATORS = {"semicolon": ";", "tab": "\t", "comma": ","}
 
-    first_semicolon = first_line.find(";")
-    first_tab = first_line.find("\t")
-    first_comma = first_line.find(",")
+# Same strings as pandas reads as missing values, so both engines give the same frame
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+QUOTED = re.compile(r'"[^"]*"')
 
-    sep_indices = {"semicolon": first_semicolon, "tab": first_tab, "comma": first_comma}
 
-    if debug:
-        print(sep_indices)
+def csv_engine() -> str:
+    return os.environ.get("ASK_HELPER_CSV_ENGINE", "pyarrow").lower()
 
-    # filter out not found
-    sep_indices = {
-        separator: index for separator, index in sep_indices.items() if index != -1
-    }
 
-    if sep_indices:
-        separator = min(sep_indices, key=sep_indices.get)
+def string_dtype() -> str | pd.StringDtype:
+    # "pyarrow" keeps the text columns in Arrow memory instead of one Python object per cell
+    if os.environ.get("ASK_HELPER_STRING_DTYPE", "object").lower() == "pyarrow":
+        return pd.StringDtype("pyarrow")
+    return str
 
-        logg.log_to_file(
-            heading="SEPARATOR",
-            data_changes=[f"Separator identified to be: {separator}"],
-        )
 
-        match separator:
-            case "semicolon":
-                return ";"  # type: str
-            case "tab":
-                return "\t"  # type: str
-            case "comma":
-                return ","  # type: str
-            case _:
-                raise Exception("Was unable to identify separator used in the file")
-    else:
+def as_text(values: pd.Series) -> pd.Series:
+    # astype(str) would turn Arrow backed strings back into Python objects
+    if isinstance(values.dtype, pd.StringDtype):
+        return values
+    return values.astype(str)
+
+
+# Columns with fewer distinct values than this share of the rows are categorical
+MAX_CATEGORY_SHARE = 0.5
+
+
+def categorical_enabled() -> bool:
+    # Set ASK_HELPER_CATEGORICAL=1 to keep low-cardinality columns as categories
+    return os.environ.get("ASK_HELPER_CATEGORICAL", "0") == "1"
+
+
+def is_categorical(values: pd.Series) -> bool:
+    return isinstance(values.dtype, pd.CategoricalDtype)
+
+
+def set_values(data: pd.DataFrame, mask: pd.Series | np.ndarray, column: str, values) -> None:
+    # A categorical column needs new values added to its categories before they are set
+    if is_categorical(data[column]):
+        if isinstance(values, pd.Series):
+            values = values.astype(object)
+        new_values = pd.unique(np.asarray([values] if isinstance(values, str) else values, dtype=object))
+        missing = [value for value in new_values if value not in data[column].cat.categories]
+        if missing:
+            data[column] = data[column].cat.add_categories(missing)
+    data.loc[mask, column] = values
+
+
+def replace_column(data: pd.DataFrame, column: str, values: pd.Series) -> None:
+    # Keeps a categorical column categorical
+    if is_categorical(data[column]):
+        values = values.astype("category")
+    data[column] = values
+
+
+def encode_categories(data: pd.DataFrame) -> None:
+    # One code per cell and one string per distinct value, instead of one string per cell
+    encoded = []
+    for column in data.columns:
+        values = data[column]
+        if is_categorical(values) or len(values) == 0:
+            continue
+        codes, uniques = pd.factorize(values)
+        if len(uniques) > len(values) * MAX_CATEGORY_SHARE:
+            continue
+        # Sorted categories, so sorting and grouping give the same order as on text
+        order = np.argsort(uniques.to_numpy(dtype=object))
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        data[column] = pd.Categorical.from_codes(rank[codes], categories=uniques.take(order))
+        encoded.append(f"{column}: {len(uniques)} distinct values")
+
+    logg.log_to_file(
+        heading="CATEGORICAL COLUMNS",
+        change_text="Stored as categories:",
+        data_changes=encoded,
+    )
+
+
+def sample_lines(ask_data: str, max_lines: int = 50) -> list[str]:
+    # Only the start of the input is looked at, it is never split as a whole
+    lines = []
+    start = 0
+    while len(lines) < max_lines and start < len(ask_data):
+        end = ask_data.find("\n", start)
+        if end == -1:
+            # The sample may stop in the middle of a line
+            if lines:
+                break
+            end = len(ask_data)
+        line = ask_data[start:end].rstrip("\r")
+        if line.strip() != "":
+            lines.append(line)
+        start = end + 1
+
+    return lines
+
+
+def get_separator(ask_data: str, debug: bool, max_lines: int = 50) -> str:
+    lines = [QUOTED.sub("", line) for line in sample_lines(ask_data, max_lines)]
+    if not lines:
         raise Exception("Was unable to identify separator used in the file")
 
+    # A separator is found in the header, and each line should have as many of
+    # it as the header. Ties are settled by which comes first in the header.
+    scores = {}
+    for name, character in SEPARATORS.items():
+        header_count = lines[0].count(character)
+        if header_count == 0:
+            continue
+        consistent = sum(1 for line in lines if line.count(character) == header_count)
+        scores[name] = (consistent / len(lines), -lines[0].find(character))
 
-def convert_data_to_df(separator: str, data: str, debug: bool = False) -> pd.DataFrame:
-    io_data = StringIO(data)
-    df = pd.read_csv(io_data, sep=separator, dtype=str).dropna(how="all")
+    if debug:
+        print(scores)
+
+    if not scores:
+        raise Exception("Was unable to identify separator used in the file")
+
+    separator = max(scores, key=scores.get)
+
+    logg.log_to_file(
+        heading="SEPARATOR",
+        data_changes=[f"Separator identified to be: {separator}"],
+    )
+
+    return SEPARATORS[separator]
+
+
+def _pandas_column_names(names: list[str]) -> list[str]:
+    # Name columns the way pd.read_csv does: "Unnamed: i" for blank names and
+    # ".1", ".2", ... for repeated names
+    names = [name or f"Unnamed: {index}" for index, name in enumerate(names)]
+    counts = {}
+    result = []
+    for name in names:
+        original = name
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[original] = count + 1
+            name = f"{original}.{count}"
+            count = count + 1 if name in names else counts.get(name, 0)
+        counts[name] = count + 1
+        result.append(name)
+
+    return result
+
+
+def _read_csv_pyarrow(
+    separator: str, data: bytes, encoding: str, debug: bool = False
+) -> pd.DataFrame:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import csv as pa_csv
+
+    header_end = data.find(b"\n")
+    header_line = data[: header_end if header_end != -1 else len(data)].decode(encoding)
+    names = _pandas_column_names(
+        next(csv.reader([header_line.rstrip("\r")], delimiter=separator))
+    )
+
+    table = pa_csv.read_csv(
+        pa.py_buffer(data),
+        read_options=pa_csv.ReadOptions(
+            use_threads=True,
+            column_names=names,
+            skip_rows=1,
+            encoding="utf8" if encoding.lower().startswith("utf") else encoding,
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=separator),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in names},
+            null_values=NA_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+
+    # Drop empty rows and columns and fill the blanks while the data is still in
+    # Arrow, row labels are kept as the pandas engine would give them
+    kept_rows = np.zeros(table.num_rows, dtype=bool)
+    for column in table.columns:
+        kept_rows |= pc.is_valid(column).to_numpy(zero_copy_only=False)
+    row_labels = np.flatnonzero(kept_rows)
+    table = table.take(row_labels)
+
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        if debug:
+            print(f"column: {name}, type: {column.type}, is empty: {column.null_count == len(column)}")
+        if column.null_count == len(column) and "Unnamed" in name:
+            continue
+        columns[name] = pc.fill_null(column, "")
+
+    dtype = string_dtype()
+    types_mapper = {pa.string(): dtype}.get if dtype is not str else None
+    df = pa.table(columns).to_pandas(types_mapper=types_mapper)
+    df.index = pd.Index(row_labels, dtype="int64")
+
+    return df
+
+
+def _read_csv_pandas(
+    separator: str, data: str | bytes, encoding: str, debug: bool = False
+) -> pd.DataFrame:
+    # BytesIO shares the buffer, the input is not copied again
+    io_data = BytesIO(data) if isinstance(data, bytes) else StringIO(data)
+    df = pd.read_csv(
+        io_data, sep=separator, dtype=string_dtype(), encoding=encoding
+    ).dropna(how="all")
 
     # remove_all_empty_columns
     for col in df.columns:
@@ -63,6 +245,35 @@ def convert_data_to_df(separator: str, data: str, debug: bool = False) -> pd.Dat
             df.drop(col, axis=1, inplace=True)
     df.fillna("", inplace=True)
 
+    return df
+
+
+def convert_data_to_df(
+    separator: str,
+    data: str | bytes,
+    debug: bool = False,
+    encoding: str = "utf-8",
+    engine: str | None = None,
+) -> pd.DataFrame:
+    engine = engine or csv_engine()
+    df = None
+    if engine == "pyarrow":
+        try:
+            if isinstance(data, str):
+                df = _read_csv_pyarrow(separator, data.encode("utf-8"), "utf-8", debug=debug)
+            else:
+                df = _read_csv_pyarrow(separator, data, encoding, debug=debug)
+        except Exception as error:
+            # Missing pyarrow or input it can not parse, e.g. rows with too few fields
+            logg.log_to_file(
+                heading="CSV ENGINE",
+                data_changes=[
+                    f"PyArrow could not read the input ({type(error).__name__}: {error}), using the pandas C engine"
+                ],
+            )
+    if df is None:
+        df = _read_csv_pandas(separator, data, encoding, debug=debug)
+
     if debug:
         print(df)
 
@@ -74,7 +285,58 @@ def convert_data_to_df(separator: str, data: str, debug: bool = False) -> pd.Dat
     return df
 
 
-def indentify_file_type(data: pd.DataFrame, debug: bool = False) -> str:
+def _count_isin_shaped(values: pd.Series) -> int:
+    return int(((values.str.len() == 12) & values.str[:2].str.isalpha()).sum())
+
+
+ISIN_PATTERN = r"[A-Z]{2}[A-Z0-9]{9}[0-9]"
+
+
+def valid_isin(values: np.ndarray) -> np.ndarray:
+    # Luhn check digit over the ISIN, letters count as two digits (A=10 ... Z=35).
+    # Computed column by column from the right for all values at once
+    values = np.asarray(values, dtype=object)
+    shaped = (
+        pd.Series(values, dtype=pd.StringDtype("pyarrow"))
+        .str.fullmatch(ISIN_PATTERN)
+        .fillna(False)
+        .to_numpy(dtype=bool)
+    )
+    valid = np.zeros(len(values), dtype=bool)
+    if not shaped.any():
+        return valid
+
+    chars = np.frombuffer("".join(values[shaped]).encode("ascii"), dtype=np.uint8).reshape(-1, 12)
+    # "0"-"9" -> 0-9, "A"-"Z" -> 10-35
+    numbers = np.where(chars >= ord("A"), chars - ord("A") + 10, chars - ord("0")).astype(np.int64)
+
+    total = np.zeros(len(numbers), dtype=np.int64)
+    double = np.ones(len(numbers), dtype=bool)
+
+    def add(digits: np.ndarray, mask: np.ndarray) -> None:
+        nonlocal double
+        doubled = np.where(double, digits * 2, digits)
+        total[mask] += (doubled // 10 + doubled % 10)[mask]
+        double = np.where(mask, ~double, double)
+
+    everything = np.ones(len(numbers), dtype=bool)
+    for position in range(10, -1, -1):
+        number = numbers[:, position]
+        letter = number >= 10
+        # A letter is two digits, the ones digit is the one further right
+        add(number % 10, everything)
+        add(number // 10, letter)
+
+    valid[shaped] = (10 - total % 10) % 10 == numbers[:, 11]
+    return valid
+
+
+def indentify_file_type(
+    data: pd.DataFrame,
+    debug: bool = False,
+    sample_size: int | None = 1000,
+    return_scores: bool = False,
+) -> str | tuple[str, dict[str, int]]:
     # Check number of columns
     ncols = len(data.columns)
     if ncols < 6:
@@ -106,70 +368,56 @@ def indentify_file_type(data: pd.DataFrame, debug: bool = False) -> str:
     score_isin = 4
     score_units = 4
 
-    isin_rfh = 0
-    isin_ptoi = 0
-    isin_ptoc = 0
-    currency_rfh = 0
-    currency_ptoi = 0
-    units_rhc = 0
+    # The row based scores are decided on the first rows, no need to scan the whole file
+    sample = data if sample_size is None else data.head(sample_size)
+    columns = [as_text(sample.iloc[:, col]) for col in range(ncols)]
+    empty = pd.Series("", index=sample.index)
 
-    for index, row in data.iterrows():
-        if len(row[data.columns[6]]) == 12 and str(row[data.columns[6]][:2]).isalpha():
-            isin_rfh += 1
-
-        if (
-            ncols > 11 and len(row[data.columns[11]]) == 12
-            and str(row[data.columns[11]][:2]).isalpha()
-        ):
-            isin_ptoi += 1
-
-        if (
-            ncols > 10 and len(row[data.columns[10]]) == 12
-            and str(row[data.columns[10]][:2]).isalpha()
-        ):
-            isin_ptoc += 1
-
-        if ncols > 9 and (
-            ("," in str(row[data.columns[9]]) or "." in str(row[data.columns[9]]))
-            or (
-                str(row[data.columns[9]]) == "NO0000000000"
-                and "," in str(row[data.columns[10]])
-                or "." in str(row[data.columns[10]])
-            )
-        ):
-            units_rhc += 1
+    isin_rfh = _count_isin_shaped(columns[6])
+    isin_ptoi = _count_isin_shaped(columns[11]) if ncols > 11 else 0
+    isin_ptoc = _count_isin_shaped(columns[10]) if ncols > 10 else 0
 
-        if ncols > 7 and len(row[data.columns[7]]) == 3:
-            currency_rfh += 1
+    units_rhc = 0
+    if ncols > 9:
+        units = columns[9]
+        next_col = columns[10] if ncols > 10 else empty
+        units_rhc = int(
+            (
+                units.str.contains(",", regex=False)
+                | units.str.contains(".", regex=False)
+                | ((units == "NO0000000000") & next_col.str.contains(",", regex=False))
+                | next_col.str.contains(".", regex=False)
+            ).sum()
+        )
 
-        if ncols > 12 and len(row[data.columns[12]]) == 3:
-            currency_ptoi += 1
+    currency_rfh = int((columns[7].str.len() == 3).sum()) if ncols > 7 else 0
+    currency_ptoi = int((columns[12].str.len() == 3).sum()) if ncols > 12 else 0
 
-    if currency_rfh >= len(data) * 2 / 3 and currency_rfh >= currency_ptoi:
+    if currency_rfh >= len(sample) * 2 / 3 and currency_rfh >= currency_ptoi:
         file_type_est["RHC"] += score_currency
-    elif currency_ptoi >= len(data) * 2 / 3 and currency_ptoi >= currency_rfh:
+    elif currency_ptoi >= len(sample) * 2 / 3 and currency_ptoi >= currency_rfh:
         file_type_est["PTOI"] += score_currency
 
     if (
-        isin_rfh >= len(data) * 2 / 3
+        isin_rfh >= len(sample) * 2 / 3
         and isin_rfh >= isin_ptoi
         and isin_rfh >= isin_ptoc
     ):
         file_type_est["RHC"] += score_isin
     elif (
-        isin_ptoi >= len(data) * 2 / 3
+        isin_ptoi >= len(sample) * 2 / 3
         and isin_ptoi >= isin_rfh
         and isin_ptoi >= isin_ptoc
     ):
         file_type_est["PTOI"] += score_isin
     elif (
-        isin_ptoc >= len(data) * 2 / 3
+        isin_ptoc >= len(sample) * 2 / 3
         and isin_ptoc >= isin_rfh
         and isin_ptoc >= isin_ptoi
     ):
         file_type_est["PTOC"] += score_isin
 
-    if units_rhc >= len(data) * 2 / 3:
+    if units_rhc >= len(sample) * 2 / 3:
         file_type_est["RHC"] += score_units
 
     max_key = max(file_type_est, key=file_type_est.get)
@@ -184,6 +432,9 @@ def indentify_file_type(data: pd.DataFrame, debug: bool = False) -> str:
 
     print(f"File identified as: {max_key}")
 
+    if return_scores:
+        return max_key, file_type_est
+
     return max_key
 
 
@@ -218,62 +469,193 @@ def update_header(data: pd.DataFrame, file_type: str) -> pd.DataFrame:
     return data
 
 
-def pad_customer_number(data: pd.DataFrame) -> None:
-    logg_msg = []
-    for index, row in data.iterrows():
-        if row["KUNDENR"] != row["KUNDENR"].zfill(11):
-            logg_msg.append(
-                f"{index +1} {row['KUNDENR']} -> {row['KUNDENR'].zfill(11)}"
+class ValueRule(NamedTuple):
+    # A step that changes each value of one column on its own, so it only has
+    # to be worked out once per distinct value
+    step: str
+    column: str
+    convert: Callable[[str], str]
+    message: Callable[[int, str, str, str], str]
+    heading: str
+    change_text: str
+    log_unchanged: bool = True
+
+
+def apply_value_rules(data: pd.DataFrame, rules: list[ValueRule]) -> None:
+    # Rules on the same column share one pass, each is logged as its own step
+    column = rules[0].column
+    values = data[column]
+    codes, uniques = pd.factorize(values)
+    current = uniques.to_numpy(dtype=object)
+    original = current
+    mtr = data["MASTERTRANSFERREF_(FULLMAKTSNR)"].to_numpy()
+
+    for rule in rules:
+        converted = np.array([rule.convert(str(value)) for value in current], dtype=object)
+        mask = (converted != current)[codes]
+        rows = data.index[mask]
+        old_values = current[codes[mask]]
+        new_values = converted[codes[mask]]
+
+        logg_msg = [
+            rule.message(index, row_mtr, old, new)
+            for index, row_mtr, old, new in zip(rows, mtr[mask], old_values, new_values)
+        ]
+        logg.record_changes(
+            step=rule.step,
+            rows=rows,
+            column=column,
+            old_values=old_values,
+            new_values=new_values,
+        )
+        if logg_msg or rule.log_unchanged:
+            logg.log_to_file(
+                heading=rule.heading,
+                change_text=rule.change_text,
+                data_changes=logg_msg,
             )
-            row["KUNDENR"] = row["KUNDENR"].zfill(11)
+        current = converted
 
-    logg.log_to_file(
-        heading="PAD CUSTOMER NUMBER",
-        change_text="Added 0 to customer number on row: ",
-        data_changes=logg_msg,
-    )
+    if current is not original and (current != original).any():
+        if is_categorical(values):
+            data[column] = pd.Series(pd.Categorical(current)[codes], index=data.index)
+        else:
+            data[column] = pd.Series(current[codes], index=data.index, dtype=values.dtype)
+
+
+TAX_KEYS = {tax.upper() for tax in conversion_data.tax_key}
+
+
+def _pad_customer_number(value: str) -> str:
+    return value.zfill(11)
+
+
+def _tax_identifier(value: str) -> str:
+    return "Skatteopplysninger" if value.upper() in TAX_KEYS else value
+
+
+def _cash_identifier(value: str) -> str:
+    stripped = value.strip()
+    return "Cash" if stripped.upper().startswith("CASH") and stripped != "Cash" else value
+
+
+PAD_CUSTOMER_NUMBER = ValueRule(
+    step="pad_customer_number",
+    column="KUNDENR",
+    convert=_pad_customer_number,
+    message=lambda index, mtr, old, new: f"{index +1} {old} -> {new}",
+    heading="PAD CUSTOMER NUMBER",
+    change_text="Added 0 to customer number on row: ",
+)
+UPDATE_TAX_IDENTIFIER = ValueRule(
+    step="update_tax_indetifier",
+    column="VERDIPAPIRNAVN",
+    convert=_tax_identifier,
+    message=lambda index, mtr, old, new: f"{index +1} [MTR: {mtr}] changed '{old}' -> 'Skatteopplysninger'",
+    heading="UPDATE TAX IDENTIFIER",
+    change_text="Changed tax identifier on row: ",
+)
+UPDATE_CASH_IDENTIFIER = ValueRule(
+    step="update_cash_identifier",
+    column="VERDIPAPIRNAVN",
+    convert=_cash_identifier,
+    message=lambda index, mtr, old, new: f"{index + 1} [MTR: {mtr}] changed '{old}' -> 'Cash'",
+    heading="UPDATE CASH IDENTIFIER",
+    change_text="Changed cash identifier on row: ",
+    log_unchanged=False,
+)
+
+
+def pad_customer_number(data: pd.DataFrame) -> None:
+    apply_value_rules(data, [PAD_CUSTOMER_NUMBER])
 
 
 def convert_distributor(data: pd.DataFrame, file_type: str) -> None: 
-    logg_msg = []
     if file_type.upper() in {"RFH", "RHC", "PTOI", "PTOC"}:
-        dist_dict = {
-            key.upper(): value for key, value in conversion_data.distributors.items()
-        }
+        index = distributor_index.distributors
         cols_conv = [0, 1]
     elif file_type.upper() == "NTO":
-        dist_dict = {
-            key.upper(): value for key, value in conversion_data.NTO_distributors.items()
-        }
+        index = distributor_index.NTO_distributors
         cols_conv = [1, 4]
 
-    for index, row in data.iterrows():
-        for col in cols_conv:
-            orig_val = str(row.iloc[col]).upper()
-            if orig_val in dist_dict:
-                logg_msg.append(
-                    f"{index +1} [{data.columns[col]}] {row.iloc[col]} -> {dist_dict[orig_val]}"
-                )
-                row.iloc[col] = dist_dict[orig_val]
+    changes = []
+    unmapped = {}
+    for order, col in enumerate(cols_conv):
+        values = data.iloc[:, col]
+        converted = index.convert(values)
+        mask = converted.notna()
+
+        changes += [
+            (position, order, f"{row +1} [{data.columns[col]}] {old} -> {new}")
+            for position, row, old, new in zip(
+                mask.to_numpy().nonzero()[0],
+                data.index[mask],
+                values[mask].to_numpy(),
+                converted[mask].to_numpy(),
+            )
+        ]
+        logg.record_changes(
+            step="convert_distributor",
+            rows=data.index[mask],
+            column=data.columns[col],
+            old_values=values[mask],
+            new_values=converted[mask].str.upper(),
+        )
+
+        for name, count in values[~mask].value_counts(sort=False).items():
+            # A categorical column also counts the categories not in these rows
+            if count and not index.is_known(str(name)):
+                unmapped[name] = unmapped.get(name, 0) + count
+
+        fill = values.astype(object) if is_categorical(values) else values
+        replace_column(data, data.columns[col], converted.fillna(fill).str.upper())
+
+    # Same order as before: row by row, receiving before sending distributor
+    logg_msg = [msg for _, _, msg in sorted(changes)]
 
-    for col in cols_conv:
-        data.iloc[:, col] = data.iloc[:, col].str.upper()
-    
     logg.log_to_file(
         heading="CONVERT DISTRIBUTOR",
         change_text="Converted distributor on row: ",
         data_changes=logg_msg,
     )
 
+    if unmapped:
+        unmapped_msg = []
+        for name, count in unmapped.items():
+            suggestion = index.suggest(str(name))
+            if suggestion is None:
+                unmapped_msg.append(f"'{name}' on {count} row(s), no close match")
+            else:
+                unmapped_msg.append(
+                    f"'{name}' on {count} row(s), closest match: '{suggestion[0]}' -> {suggestion[1]}"
+                )
+
+        logg.log_to_file(
+            heading="UNMAPPED DISTRIBUTORS",
+            change_text="Not in conversion_data:",
+            data_changes=unmapped_msg,
+        )
+
 
 def check_for_units_in_ptoi(data: pd.DataFrame) -> None:
-    logg_msg = []
-    for index, row in data.iterrows():
-        if row["ANTALL_ANDELER"] != "":
-            logg_msg.append(
-                f"{index +1} [TRANSFER_REF: {row['TRANSFER_REF']}, value removed: {row['ANTALL_ANDELER']}]"
-            )
-            row["ANTALL_ANDELER"] = ""
+    mask = data["ANTALL_ANDELER"] != ""
+
+    logg_msg = [
+        f"{index +1} [TRANSFER_REF: {transfer_ref}, value removed: {units}]"
+        for index, transfer_ref, units in zip(
+            data.index[mask],
+            data.loc[mask, "TRANSFER_REF"],
+            data.loc[mask, "ANTALL_ANDELER"],
+        )
+    ]
+    logg.record_changes(
+        step="check_for_units_in_ptoi",
+        rows=data.index[mask],
+        column="ANTALL_ANDELER",
+        old_values=data.loc[mask, "ANTALL_ANDELER"],
+        new_values="",
+    )
+    set_values(data, mask, "ANTALL_ANDELER", "")
 
     logg.log_to_file(
         heading="REMOVE UNITS PTOI",
@@ -283,13 +665,22 @@ def check_for_units_in_ptoi(data: pd.DataFrame) -> None:
 
 
 def set_tax_value_per_isin(data: pd.DataFrame) -> None:
-    logg_msg = []
-    for index, row in data.iterrows():
-        if row["KOSTPRIS_PR_ISIN"] == "" and row["ISIN"] != "":
-            logg_msg.append(
-                f"{index +1} [ISIN: {row['ISIN']}, TRANSFER_REF: {row['TRANSFER_REF']}]"
-            )
-            row["KOSTPRIS_PR_ISIN"] = "0"
+    mask = (data["KOSTPRIS_PR_ISIN"] == "") & (data["ISIN"] != "")
+
+    logg_msg = [
+        f"{index +1} [ISIN: {isin}, TRANSFER_REF: {transfer_ref}]"
+        for index, isin, transfer_ref in zip(
+            data.index[mask], data.loc[mask, "ISIN"], data.loc[mask, "TRANSFER_REF"]
+        )
+    ]
+    logg.record_changes(
+        step="set_tax_value_per_isin",
+        rows=data.index[mask],
+        column="KOSTPRIS_PR_ISIN",
+        old_values=data.loc[mask, "KOSTPRIS_PR_ISIN"],
+        new_values="0",
+    )
+    set_values(data, mask, "KOSTPRIS_PR_ISIN", "0")
 
     logg.log_to_file(
         heading="SET TAX VALUE PER ISIN",
@@ -299,77 +690,72 @@ def set_tax_value_per_isin(data: pd.DataFrame) -> None:
 
 
 def update_tax_indetifier(data: pd.DataFrame) -> None:
-    logg_msg = []
-    for index, row in data.iterrows():
-        if str(row["VERDIPAPIRNAVN"]).upper() in [
-            tax.upper() for tax in conversion_data.tax_key
-        ]:
-            logg_msg.append(
-                f"{index +1} [MTR: {row['MASTERTRANSFERREF_(FULLMAKTSNR)']}] changed '{row['VERDIPAPIRNAVN']}' -> 'Skatteopplysninger'"
-            )
-            row["VERDIPAPIRNAVN"] = "Skatteopplysninger"
-
-    logg.log_to_file(
-        heading="UPDATE TAX IDENTIFIER",
-        change_text="Changed tax identifier on row: ",
-        data_changes=logg_msg,
-    )
+    apply_value_rules(data, [UPDATE_TAX_IDENTIFIER])
 
 
 def update_cash_identifier(data: pd.DataFrame) -> None:
-    logg_msg = []
-    for index, row in data.iterrows():
-        verdipapirnavn = str(row["VERDIPAPIRNAVN"]).strip()
-        if verdipapirnavn.upper().startswith("CASH") and verdipapirnavn != "Cash":
-            logg_msg.append(
-                f"{index + 1} [MTR: {row['MASTERTRANSFERREF_(FULLMAKTSNR)']}] changed '{row['VERDIPAPIRNAVN']}' -> 'Cash'"
-            )
-            data.at[index, "VERDIPAPIRNAVN"] = "Cash"
-
-    if logg_msg:
-        logg.log_to_file(
-            heading="UPDATE CASH IDENTIFIER",
-            change_text="Changed cash identifier on row: ",
-            data_changes=logg_msg,
-        )
+    apply_value_rules(data, [UPDATE_CASH_IDENTIFIER])
 
 
 def set_tax_and_cash_account(data: pd.DataFrame) -> None:
     logg_msg = []
-    unique_mtrs = data["MASTERTRANSFERREF_(FULLMAKTSNR)"].unique()
+    mtr = data["MASTERTRANSFERREF_(FULLMAKTSNR)"]
+    account = data["TIL_ASK_KONTO_KUNDE_TILBYDER"]
+    name = data["VERDIPAPIRNAVN"]
+
+    # Distinct non-blank accounts per MTR, in the order they appear
+    has_account = as_text(account).str.strip() != ""
+    mtr_accounts = pd.DataFrame({"mtr": mtr, "account": account})[has_account].drop_duplicates()
+    accounts_per_mtr = {}
+    for current_mtr, current_account in zip(mtr_accounts["mtr"], mtr_accounts["account"]):
+        accounts_per_mtr.setdefault(current_mtr, []).append(current_account)
+    single_account = {
+        current_mtr: accounts[0]
+        for current_mtr, accounts in accounts_per_mtr.items()
+        if len(accounts) == 1
+    }
 
-    for mtr in unique_mtrs:
-        mtr_rows = data[data["MASTERTRANSFERREF_(FULLMAKTSNR)"] == mtr]
-        unique_accounts = mtr_rows["TIL_ASK_KONTO_KUNDE_TILBYDER"].dropna().unique()
-        unique_accounts = [acc for acc in unique_accounts if acc.strip()]
+    correct_account = mtr.map(single_account)
+    fill_mask = (
+        correct_account.notna()
+        & (account == "")
+        & name.isin(["Cash", "Skatteopplysninger"])
+    )
+    updated = {
+        category: set(mtr[fill_mask & (name == category)])
+        for category in ["Cash", "Skatteopplysninger"]
+    }
+
+    for current_mtr in mtr.unique():
+        unique_accounts = accounts_per_mtr.get(current_mtr, [])
 
         if len(unique_accounts) > 1:
-            error_msg = f"Error: More than one account number for {mtr}: {unique_accounts}. Account number for MTR is excluded from the file."
-            print(Fore.RED + "!!! - " + error_msg + Style.RESET_ALL)
+            error_msg = f"Error: More than one account number for {current_mtr}: {unique_accounts}. Account number for MTR is excluded from the file."
+            logg.print_warning(error_msg)
             logg_msg.append(error_msg)
             continue
         
         elif len(unique_accounts) == 0:
-            error_msg = f"Warning: No account number found for {mtr}. No updates applied for this MTR."
-            print(Fore.RED + "!!! - " + error_msg + Style.RESET_ALL)
+            error_msg = f"Warning: No account number found for {current_mtr}. No updates applied for this MTR."
+            logg.print_warning(error_msg)
             logg_msg.append(error_msg)
             continue
-        
-        correct_account = unique_accounts[0]
-        updated_entries = []
-
-        for category in ["Cash", "Skatteopplysninger"]:
-            mask = (data["MASTERTRANSFERREF_(FULLMAKTSNR)"] == mtr) & \
-                   (data["VERDIPAPIRNAVN"] == category) & \
-                   (data["TIL_ASK_KONTO_KUNDE_TILBYDER"] == "")
-            
-            if mask.any():
-                data.loc[mask, "TIL_ASK_KONTO_KUNDE_TILBYDER"] = correct_account
-                updated_entries.append(category)
 
+        updated_entries = [
+            category for category, mtrs in updated.items() if current_mtr in mtrs
+        ]
         if updated_entries:
             categories_updated = " and ".join(updated_entries)
-            logg_msg.append(f"Updated account number {correct_account} for {categories_updated} in MTR {mtr}.")
+            logg_msg.append(f"Updated account number {unique_accounts[0]} for {categories_updated} in MTR {current_mtr}.")
+
+    logg.record_changes(
+        step="set_tax_and_cash_account",
+        rows=data.index[fill_mask],
+        column="TIL_ASK_KONTO_KUNDE_TILBYDER",
+        old_values=account[fill_mask],
+        new_values=correct_account[fill_mask],
+    )
+    set_values(data, fill_mask, "TIL_ASK_KONTO_KUNDE_TILBYDER", correct_account[fill_mask])
 
     if logg_msg:
         logg.log_to_file(
@@ -380,25 +766,43 @@ def set_tax_and_cash_account(data: pd.DataFrame) -> None:
 
 
 def check_valid_error_code(data: pd.DataFrame) -> None:
-    for index, row in data.iterrows():
-        if row["FEILKODE"] not in ["A", "B", "C", "D", "E", "F", "G", "H", ""]:
-            print(f"\n\nInvalid error code was given in file {row['FEILKODE']}")
-            raise Exception(f"Invalid error code on row {index + 1}: {row['FEILKODE']}")
+    mask = ~data["FEILKODE"].isin(schema.ERROR_CODES)
+    if mask.any():
+        index = data.index[mask][0]
+        error_code = data.at[index, "FEILKODE"]
+        print(f"\n\nInvalid error code was given in file {error_code}")
+        raise Exception(f"Invalid error code on row {index + 1}: {error_code}")
 
 
 def move_tax_data(data: pd.DataFrame) -> None:
-    logg_msg = []
-    for index, row in data.iterrows():
-        if (
-            row["VERDIPAPIRNAVN"] == "Skatteopplysninger"
-            and row["KOSTPRIS_PR_ISIN"] != ""
-            and row["FLYTTET_KOSTPRIS_ASK"] == ""
-        ):
-            logg_msg.append(
-                f"{index +1} [MTR: {row['MASTERTRANSFERREF_(FULLMAKTSNR)']}] KOSTPRIS_PR_ISIN moved to FLYTTET_KOSTPRIS_ASK for Skatteopplysninger"
-            )
-            row["FLYTTET_KOSTPRIS_ASK"] = row["KOSTPRIS_PR_ISIN"]
-            row["KOSTPRIS_PR_ISIN"] = ""
+    mask = (
+        (data["VERDIPAPIRNAVN"] == "Skatteopplysninger")
+        & (data["KOSTPRIS_PR_ISIN"] != "")
+        & (data["FLYTTET_KOSTPRIS_ASK"] == "")
+    )
+
+    logg_msg = [
+        f"{index +1} [MTR: {mtr}] KOSTPRIS_PR_ISIN moved to FLYTTET_KOSTPRIS_ASK for Skatteopplysninger"
+        for index, mtr in zip(
+            data.index[mask], data.loc[mask, "MASTERTRANSFERREF_(FULLMAKTSNR)"]
+        )
+    ]
+    logg.record_changes(
+        step="move_tax_data",
+        rows=data.index[mask],
+        column="FLYTTET_KOSTPRIS_ASK",
+        old_values=data.loc[mask, "FLYTTET_KOSTPRIS_ASK"],
+        new_values=data.loc[mask, "KOSTPRIS_PR_ISIN"],
+    )
+    logg.record_changes(
+        step="move_tax_data",
+        rows=data.index[mask],
+        column="KOSTPRIS_PR_ISIN",
+        old_values=data.loc[mask, "KOSTPRIS_PR_ISIN"],
+        new_values="",
+    )
+    set_values(data, mask, "FLYTTET_KOSTPRIS_ASK", data.loc[mask, "KOSTPRIS_PR_ISIN"])
+    set_values(data, mask, "KOSTPRIS_PR_ISIN", "")
     logg.log_to_file(
         heading="MOVE TAX DATA",
         change_text="Moved tax data on row: ",
@@ -406,7 +810,45 @@ def move_tax_data(data: pd.DataFrame) -> None:
     )
 
 
-def convert_to_numeric(data: pd.DataFrame, file_type: str) -> pd.DataFrame:
+# Spaces found in amounts, also the non-breaking spaces of Norwegian number
+# formatting. The regular expressions of Arrow strings do not count them as \s
+NUMBER_SPACES = r"\s" + "\u00a0\u202f"
+
+
+def detect_decimal_separator(values: pd.Series) -> str | None:
+    # The separator appearing last in a value is counted as its decimal separator
+    last_comma = values.str.rfind(",")
+    last_period = values.str.rfind(".")
+    has_separator = (last_comma != -1) | (last_period != -1)
+
+    count_comma = (has_separator & (last_comma > last_period)).sum()
+    count_period = (has_separator & (last_comma <= last_period)).sum()
+
+    if count_comma == count_period == 0:
+        return None
+
+    return "," if count_comma > count_period else "."
+
+
+def parse_numeric(values: pd.Series, decimal: str) -> tuple[pd.Series, pd.Series]:
+    thousands = "." if decimal == "," else ","
+    cleaned = (
+        values.str.replace(rf"[{NUMBER_SPACES}]+", "", regex=True)
+        .str.replace("−", "-", regex=False)
+        .str.replace(thousands, "", regex=False)
+        .str.replace(decimal, ".", regex=False)
+    )
+    numeric = pd.to_numeric(cleaned, errors="coerce").astype("float64")
+    failed = numeric.isna() & (cleaned != "")
+
+    return numeric.mask(cleaned == "", 0.0), failed
+
+
+def convert_to_numeric(
+    data: pd.DataFrame,
+    file_type: str,
+    separators: dict[str, str | None] | None = None,
+) -> dict[str, str | None]:
     logg_msg = []
     columns_to_convert = []
     match file_type:
@@ -425,31 +867,34 @@ def convert_to_numeric(data: pd.DataFrame, file_type: str) -> pd.DataFrame:
                 "BENYTTET_SKJERMING_HIA",
             ]
         case _:
-            return
+            return {}
 
-    count_comma = 0
-    count_period = 0
-
-    for index, row in data.iterrows():
-        for field in columns_to_convert:
-            data[field] = data[field].str.strip().str.replace(r'\s+', '', regex=True)
-            comma = row[field].find(",")
-            period = row[field].find(".")
-
-            if comma != -1 or period != -1:
-                if comma > period:
-                    count_comma += 1
-                else:
-                    count_period += 1
-
-    sep_to_drop = "." if count_comma > count_period else ","
-    sep_used = "," if count_comma > count_period else "."
+    separators = dict(separators or {})
+    failed_cells = []
 
     for field in columns_to_convert:
-        data[field] = data[field].str.replace(sep_to_drop, "").str.replace(",", ".")
-        data[field] = pd.to_numeric(data[field]).fillna(0)
+        values = as_text(data[field])
+        if separators.get(field) is None:
+            separators[field] = detect_decimal_separator(values)
+        # A column without any separator parses the same either way
+        decimal = separators[field] or "."
+
+        numeric, failed = parse_numeric(values, decimal)
+        failed_cells += [
+            f"{index +1} [{field}] '{value}'"
+            for index, value in zip(data.index[failed], values[failed])
+        ]
+        logg.record_changes(
+            step="convert_to_numeric",
+            rows=data.index[failed],
+            column=field,
+            old_values=values[failed],
+            new_values="",
+        )
+        data[field] = numeric
+
         logg_msg.append(
-            f'"{field}" converted to numeric with separator assumed to be: "{sep_used}"'
+            f'"{field}" converted to numeric with separator assumed to be: "{decimal}"'
         )
 
     logg.log_to_file(
@@ -458,6 +903,23 @@ def convert_to_numeric(data: pd.DataFrame, file_type: str) -> pd.DataFrame:
         data_changes=logg_msg,
     )
 
+    if failed_cells:
+        error_msg = f"Warning: {len(failed_cells)} value(s) could not be converted to numeric, please verify."
+        logg.print_warning(error_msg)
+
+        logg.log_to_file(
+            heading="NUMERIC CONVERSION FAILED",
+            change_text="Left empty on row: ",
+            data_changes=failed_cells,
+        )
+
+    return separators
+
+
+def grouping_enabled() -> bool:
+    # Set ASK_HELPER_GROUP_FUNDS=1 to sum the rows of the same fund
+    return os.environ.get("ASK_HELPER_GROUP_FUNDS", "0") == "1"
+
 
 def group_same_fund(
     data: pd.DataFrame,
@@ -467,6 +929,16 @@ def group_same_fund(
     match file_type:
         case "RHC":
             columns_to_sum = ["ANTALL_ANDELER", "VERDI"]
+            fund_keys = [
+                "MOTTAKENDE_PART_(TILBYDER)",
+                "AVLEVERENDE_PART",
+                "MASTERTRANSFERREF_(FULLMAKTSNR)",
+                "FRA_KONTO_KUNDE",
+                "FRA_KONTO_NOMINEE",
+                "ISIN",
+                "VALUTA",
+                "VERDIPAPIRNAVN",
+            ]
         case "PTOC":
             columns_to_sum = [
                 "ANTALL_FLYTTET",
@@ -476,102 +948,226 @@ def group_same_fund(
                 "UBENYTTET_SKJERMING_31.12",
                 "BENYTTET_SKJERMING_HIA",
             ]
+            fund_keys = [
+                "MOTTAKENDE_TILBYDER",
+                "AVLEVERENDE_TILBYDER",
+                "MASTERTRANSFERREF_(FULLMAKTSNR)",
+                "ASK_KONTO_KUNDE",
+                "TIL_ASK_KONTO_KUNDE_TILBYDER",
+                "TIL_ASK_BANKKONTO_TILBYDER",
+                "TIL_KONTO_NOMINEE_TILBYDER",
+                "FRA_KONTO_NOMINEE",
+                "ISIN",
+                "VALUTA",
+                "VERDIPAPIRNAVN",
+                "FLYTTET_KONTANTER",
+            ]
         case _:
             return
 
-    current_header = data.columns.tolist()
-
-    if file_type == "RHC":
-        data = (
-            data.groupby(
-                [field for field in current_header if field not in columns_to_sum]
-            )[columns_to_sum]
-            .sum()
-            .round(8)
-            .reset_index()
+    # Only rows equal in every column that is not summed are grouped, so no
+    # FEILKODE, comment or customer data is lost. TRANSFER_REF is taken from the first row
+    other_columns = [
+        column for column in data.columns if column not in columns_to_sum + fund_keys + ["TRANSFER_REF"]
+    ]
+    rows_before = len(data)
+    fund = _group_numbers(data, fund_keys)
+    group = _group_numbers(data, other_columns, fund)
+    first = ~pd.Series(group).duplicated().to_numpy()
+    not_grouped = _not_grouped(data, fund, group, other_columns)
+
+    if first.all():
+        logg.log_to_file(
+            heading="GROUPPING DATA",
+            data_changes=[f"{rows_before} rows, no fund with more than one equal row"] + not_grouped,
         )
-    else:
-        data = (
-            data.groupby(
-                [
-                    field
-                    for field in current_header
-                    if field not in columns_to_sum + ["TRANSFER_REF"]
-                ]
-            )
-            .agg(
-                {
-                    **{
-                        col: "first"
-                        for col in current_header
-                        if col in ["TRANSFER_REF"]
-                    },
-                    **{col: "sum" for col in columns_to_sum},
-                }
-            )
-            .round(8)
-            .reset_index()
+        return
+
+    # The first row of each group is kept in place with the sums
+    sums = data[columns_to_sum].groupby(group, sort=False).sum().round(8)
+    sizes = np.bincount(group)
+    merged = first & (sizes[group] > 1)
+    first_rows = data.index[first]
+    merged_rows = data.index[merged]
+
+    for field in columns_to_sum:
+        old_values = data.loc[merged, field].to_numpy()
+        new_values = sums[field].to_numpy()[group[merged]]
+        changed = old_values != new_values
+        logg.record_changes(
+            step="group_same_fund",
+            rows=merged_rows[changed],
+            column=field,
+            old_values=list(old_values[changed]),
+            new_values=list(new_values[changed]),
         )
-
-    data = data[current_header]
+        data.loc[merged, field] = new_values
+
+    removed = data.index[~first]
+    logg.record_changes(
+        step="group_same_fund",
+        rows=removed,
+        column="",
+        old_values=[", ".join(str(value) for value in row) for row in data.loc[~first].itertuples(index=False)],
+        new_values=[f"row grouped into row {row + 1}" for row in first_rows[group[~first]]],
+    )
+    data.drop(index=removed, inplace=True)
 
     logg.log_to_file(
         heading="GROUPPING DATA",
-        change_text="Grouped data by ISIN:\n",
-        data_changes=[data],
+        data_changes=[
+            f"{rows_before} rows grouped to {len(data)} rows",
+            f"{len(merged_rows)} funds had more than one equal row, {', '.join(columns_to_sum)} summed",
+        ]
+        + not_grouped,
     )
 
-    return data
-
 
-def add_distributor(data: pd.DataFrame, file_type: str) -> None:
-    logg_msg = []
+def _group_numbers(data: pd.DataFrame, keys: list[str], group: np.ndarray | None = None) -> np.ndarray:
+    # Group number per row in the order first found, blank and missing keys
+    # are a group of their own. Each column is factorized once and combined
+    # with the groups so far, instead of hashing the rows as tuples
+    if group is None:
+        group = np.zeros(len(data), dtype=np.int64)
+    for column in keys:
+        codes, uniques = pd.factorize(data[column], use_na_sentinel=False)
+        group = pd.factorize(group * len(uniques) + codes)[0]
+    return group
+
+
+def _not_grouped(data: pd.DataFrame, fund: np.ndarray, group: np.ndarray, other_columns: list[str]) -> list[str]:
+    # Rows of the same fund that differ in other columns are left as they are
+    groups_per_fund = pd.Series(group).groupby(fund).nunique().to_numpy()
+    split = groups_per_fund[fund] > 1
+    if not split.any():
+        return []
+
+    rows = data[split]
+    differing = rows[other_columns].astype(object).groupby(fund[split], sort=False).nunique(dropna=False) > 1
+    row_numbers = pd.Series(rows.index + 1).groupby(fund[split], sort=False).agg(list)
+    logg.print_warning(
+        f"Warning: {len(row_numbers)} fund(s) have rows that differ in other columns and were not grouped, see GROUPPING DATA in log.txt"
+    )
 
-    data.iloc[:, 0] = data.iloc[:, 0].astype(str).str.strip()
-    data.iloc[:, 1] = data.iloc[:, 1].astype(str).str.strip()
+    return [
+        f"Rows {', '.join(str(row) for row in numbers)} not grouped, they differ in {', '.join(np.array(other_columns)[differing.loc[key].to_numpy()])}"
+        for key, numbers in row_numbers.items()
+    ]
 
-    for mtr, mtr_rows in data.groupby("MASTERTRANSFERREF_(FULLMAKTSNR)"):
-        mottakende = set(mtr_rows.iloc[:, 0].dropna()) - {""}
-        avleverende = set(mtr_rows.iloc[:, 1].dropna()) - {""}
 
-        if len(mottakende) > 1 or len(avleverende) > 1:
-            msg = f"Error: More than one distributor for {mtr}. Could not fill empty distributor for this MTR"
-            print(Fore.RED + "!!! - " + msg + Style.RESET_ALL)
-            logg_msg.append(msg)
-            raise Exception(msg)
+def add_distributor(
+    data: pd.DataFrame, file_type: str, collect_conflicts: bool = False
+) -> None:
+    for col in [0, 1]:
+        if is_categorical(data.iloc[:, col]):
+            replace_column(data, data.columns[col], data.iloc[:, col].str.strip())
+        else:
+            data.iloc[:, col] = as_text(data.iloc[:, col]).str.strip()
+
+    mtr = data["MASTERTRANSFERREF_(FULLMAKTSNR)"]
+    mtrs = pd.Index(mtr.unique()).sort_values()
+
+    # Number of distinct distributors and the distributor to fill in, per MTR
+    distributor_count = []
+    distributor_value = []
+    for col in [0, 1]:
+        values = data.iloc[:, col]
+        non_blank = values != ""
+        grouped = values[non_blank].groupby(mtr[non_blank], observed=True)
+        distributor_count.append(grouped.nunique().reindex(mtrs, fill_value=0))
+        distributor_value.append(grouped.first())
+
+    conflict = (distributor_count[0] > 1) | (distributor_count[1] > 1)
+    missing = ~conflict & ((distributor_count[0] == 0) | (distributor_count[1] == 0))
+
+    problem_msg = []
+    for problem_mtr in mtrs[(conflict | missing).to_numpy()]:
+        if conflict[problem_mtr]:
+            problem_msg.append(f"Error: More than one distributor for {problem_mtr}. Could not fill empty distributor for this MTR")
+        else:
+            problem_msg.append(f"Warning: No distributor found for {problem_mtr}. Could not fill empty distributor for this MTR.")
+        if not collect_conflicts:
+            break
+
+    for msg in problem_msg:
+        logg.print_warning(msg)
+
+    if problem_msg and not collect_conflicts:
+        logg.log_to_file(
+            heading="ADD DISTRIBUTOR",
+            change_text="Added distributor on row: ",
+            data_changes=problem_msg,
+        )
+        raise Exception(problem_msg[0])
+
+    valid_row = (~(conflict | missing)).reindex(mtr).to_numpy()
+    changes = []
+    for col in [0, 1]:
+        values = data.iloc[:, col]
+        mask = (values == "") & valid_row
+        fill_values = mtr[mask].map(distributor_value[col]).astype(values.dtype)
+
+        changes += [
+            (row_mtr, col, position, f"{row+1} [{data.columns[col]}] Empty -> {value}")
+            for row_mtr, position, row, value in zip(
+                mtr[mask].to_numpy(),
+                mask.to_numpy().nonzero()[0],
+                data.index[mask],
+                fill_values.to_numpy(),
+            )
+        ]
+        logg.record_changes(
+            step="add_distributor",
+            rows=data.index[mask],
+            column=data.columns[col],
+            old_values=values[mask],
+            new_values=fill_values,
+        )
+        set_values(data, mask, data.columns[col], fill_values)
 
-        if not mottakende or not avleverende:
-            msg = f"Warning: No distributor found for {mtr}. Could not fill empty distributor for this MTR."
-            print(Fore.RED + "!!! - " + msg + Style.RESET_ALL)
-            logg_msg.append(msg)
-            raise Exception(msg)
+    # Same order as before: MTR by MTR, receiving before sending distributor
+    logg_msg = [msg for _, _, _, msg in sorted(changes)]
 
-        for index, value in [(0, next(iter(mottakende))), (1, next(iter(avleverende)))]:
-            mask = (data["MASTERTRANSFERREF_(FULLMAKTSNR)"] == mtr) & (data.iloc[:, index] == "")
-            if mask.any():
-                data.loc[mask, data.columns[index]] = value
-                for row in data.index[mask]:
-                    logg_msg.append(f"{row+1} [{data.columns[index]}] Empty -> {value}")
+    logg.log_to_file(
+        heading="ADD DISTRIBUTOR",
+        change_text="Added distributor on row: ",
+        data_changes=logg_msg,
+    )
 
+    if problem_msg:
         logg.log_to_file(
-            heading="ADD DISTRIBUTOR",
-            change_text="Added distributor on row: ",
-            data_changes=logg_msg,
+            heading="DISTRIBUTOR CONFLICTS",
+            change_text="Not filled:",
+            data_changes=problem_msg,
         )
 
 
 def remove_duplicate(data: pd.DataFrame) -> pd.DataFrame:
     logg_msg = []
-    duplicate_rows = data[data.duplicated(keep='first')]
-    data.drop_duplicates(inplace=True)
+    # The rows are hashed once, drop_duplicates would hash them again
+    duplicated = data.duplicated(keep="first").to_numpy()
+    duplicate_rows = data[duplicated]
+    if duplicated.any():
+        data.drop(index=data.index[duplicated], inplace=True)
     
     if not duplicate_rows.empty:
-        for index, row in duplicate_rows.iterrows():
-            row_values = ', '.join(str(value) for value in row.values)
+        removed_rows = [
+            ', '.join(str(value) for value in row)
+            for row in duplicate_rows.itertuples(index=False)
+        ]
+        for index, row_values in zip(duplicate_rows.index, removed_rows):
             logg_msg.append(f"{index+1} {row_values}")
 
+        logg.record_changes(
+            step="remove_duplicate",
+            rows=duplicate_rows.index,
+            column="",
+            old_values=removed_rows,
+            new_values="row removed",
+        )
+
         error_msg = f"Warning: Removed a duplicate row, please verify."
-        print(Fore.RED + "!!! - " + error_msg + Style.RESET_ALL)
+        logg.print_warning(error_msg)
 
         logg.log_to_file(
             heading="REMOVE DUPLICATES",
@@ -583,13 +1179,24 @@ def remove_duplicate(data: pd.DataFrame) -> pd.DataFrame:
 
 
 def remove_negative_cash(data: pd.DataFrame) -> None:
-    logg_msg = []
-    for index, row in data.iterrows():
-        if row["VERDI"].startswith("-") and row["FEILKODE"]=="G" and row["VERDIPAPIRNAVN"].upper()=="CASH":
-            logg_msg.append(
-                f"{index+1} [{row['VERDI']}] -> 0"
-            )
-            row["VERDI"] = "0"
+    mask = (
+        data["VERDI"].str.startswith("-")
+        & (data["FEILKODE"] == "G")
+        & (data["VERDIPAPIRNAVN"].str.upper() == "CASH")
+    )
+
+    logg_msg = [
+        f"{index+1} [{value}] -> 0"
+        for index, value in zip(data.index[mask], data.loc[mask, "VERDI"])
+    ]
+    logg.record_changes(
+        step="remove_negative_cash",
+        rows=data.index[mask],
+        column="VERDI",
+        old_values=data.loc[mask, "VERDI"],
+        new_values="0",
+    )
+    set_values(data, mask, "VERDI", "0")
 
     logg.log_to_file(
         heading="REMOVE NEGATIVE CASH",
@@ -600,8 +1207,18 @@ def remove_negative_cash(data: pd.DataFrame) -> None:
 
 def move_misplaced_accountno(data: pd.DataFrame) -> None:
     logg_msg=[]
+    starts_with_distributor = pd.Series(
+        [
+            str(name).startswith(str(distributor))
+            for name, distributor in zip(
+                data["VERDIPAPIRNAVN"], data["MOTTAKENDE_TILBYDER"]
+            )
+        ],
+        index=data.index,
+        dtype=bool,
+    )
     mask = (
-        data.apply(lambda r: str(r["VERDIPAPIRNAVN"]).startswith(str(r["MOTTAKENDE_TILBYDER"])), axis=1) &
+        starts_with_distributor &
         (data["SELG_ALLE_ANDELER"] == "N") &
         (data["TIL_KONTO_NOMINEE_TILBYDER"].str.strip() == "") & 
         (data["TIL_ASK_KONTO_KUNDE_TILBYDER"]!="")
@@ -612,8 +1229,22 @@ def move_misplaced_accountno(data: pd.DataFrame) -> None:
         logg_msg.append(
         f"{index+1} from TIL_ASK_KONTO_KUNDE_TILBYDER -> TIL_KONTO_NOMINEE_TILBYDER"
         )
-    data.loc[mask, "TIL_KONTO_NOMINEE_TILBYDER"] = data.loc[mask, "TIL_ASK_KONTO_KUNDE_TILBYDER"]
-    data.loc[mask, "TIL_ASK_KONTO_KUNDE_TILBYDER"] = ""
+    logg.record_changes(
+        step="move_misplaced_accountno",
+        rows=data.index[mask],
+        column="TIL_KONTO_NOMINEE_TILBYDER",
+        old_values=data.loc[mask, "TIL_KONTO_NOMINEE_TILBYDER"],
+        new_values=data.loc[mask, "TIL_ASK_KONTO_KUNDE_TILBYDER"],
+    )
+    logg.record_changes(
+        step="move_misplaced_accountno",
+        rows=data.index[mask],
+        column="TIL_ASK_KONTO_KUNDE_TILBYDER",
+        old_values=data.loc[mask, "TIL_ASK_KONTO_KUNDE_TILBYDER"],
+        new_values="",
+    )
+    set_values(data, mask, "TIL_KONTO_NOMINEE_TILBYDER", data.loc[mask, "TIL_ASK_KONTO_KUNDE_TILBYDER"])
+    set_values(data, mask, "TIL_ASK_KONTO_KUNDE_TILBYDER", "")
     
     logg.log_to_file(
         heading="MOVED MISPLACED ACCOUNT NUMBER",
@@ -626,20 +1257,168 @@ def fix_sell_cash(data: pd.DataFrame) ->None:
 
     selg_column = "SELG_ALLE_ANDELER" if "SELG_ALLE_ANDELER" in data.columns else "SELG_ANDELER"
     
-    for index, row in data.iterrows():
-        if row[selg_column].strip() == "" and row["VERDIPAPIRNAVN"].upper() == "CASH":
-            logg_msg.append(
-                f"{index+1} [{row[selg_column]}] -> N"
-            )
-            row[selg_column] = "N"
-        if row["STOPP_SPAREAVTALE"].strip() =="":
-            logg_msg.append(
-                f"{index+1} [{row["STOPP_SPAREAVTALE"]}] -> J"
-            )
-            row["STOPP_SPAREAVTALE"] = "J"
+    sell_mask = (data[selg_column].str.strip() == "") & (
+        data["VERDIPAPIRNAVN"].str.upper() == "CASH"
+    )
+    stop_mask = data["STOPP_SPAREAVTALE"].str.strip() == ""
+
+    # Keep the per-row order of the log: sell flag before stop flag
+    changed = sell_mask | stop_mask
+    for index, sell, stop, selg_value, stop_value in zip(
+        data.index[changed],
+        sell_mask[changed],
+        stop_mask[changed],
+        data.loc[changed, selg_column],
+        data.loc[changed, "STOPP_SPAREAVTALE"],
+    ):
+        if sell:
+            logg_msg.append(f"{index+1} [{selg_value}] -> N")
+        if stop:
+            logg_msg.append(f"{index+1} [{stop_value}] -> J")
+
+    logg.record_changes(
+        step="fix_sell_cash",
+        rows=data.index[sell_mask],
+        column=selg_column,
+        old_values=data.loc[sell_mask, selg_column],
+        new_values="N",
+    )
+    logg.record_changes(
+        step="fix_sell_cash",
+        rows=data.index[stop_mask],
+        column="STOPP_SPAREAVTALE",
+        old_values=data.loc[stop_mask, "STOPP_SPAREAVTALE"],
+        new_values="J",
+    )
+    set_values(data, sell_mask, selg_column, "N")
+    set_values(data, stop_mask, "STOPP_SPAREAVTALE", "J")
 
     logg.log_to_file(
         heading="FIX J/N ON SELL ALL UNITS AND STOP AGREEMENT",
         change_text="Added J/N to row : ",
         data_changes=logg_msg,
-    )
\ No newline at end of file
+    )
+
+def remove_earlier_delivered(data: pd.DataFrame, file_type: str) -> pd.DataFrame:
+    # Lines with the same key as a line in an earlier file of the same type
+    mode = duplicate_index.mode()
+    if mode == "off":
+        return data
+
+    keys = conversion_data.duplicate_keys[file_type]
+    hashes, has_key = duplicate_index.fingerprints(data, file_type)
+    duplicate_index.checked(file_type, hashes[has_key], data.loc[has_key, keys])
+    earlier = report_earlier_delivered(file_type, hashes[has_key], data.loc[has_key, keys], mode)
+    if mode == "drop" and earlier.any():
+        rows = data.index[has_key][earlier]
+        removed_rows = [
+            ", ".join(str(value) for value in row)
+            for row in data.loc[rows].itertuples(index=False)
+        ]
+        logg.record_changes(
+            step="remove_earlier_delivered",
+            rows=rows,
+            column="",
+            old_values=removed_rows,
+            new_values="row removed",
+        )
+        data.drop(index=rows, inplace=True)
+
+    return data
+
+
+def report_earlier_delivered(file_type: str, hashes: np.ndarray, keys: pd.DataFrame, mode: str) -> np.ndarray:
+    # Which of the lines were delivered in an earlier file, listed under
+    # EARLIER DELIVERIES. The others are added to the index when the output is saved
+    delivered = duplicate_index.delivered_before(file_type, hashes)
+    earlier = delivered > 0
+    duplicate_index.add(file_type, hashes[~earlier])
+    if not earlier.any():
+        return earlier
+
+    key_values = [
+        ", ".join(str(value) for value in row)
+        for row in keys[earlier].itertuples(index=False)
+    ]
+    # Lines delivered in the same run share the time, so each is formatted once
+    dates = {first: f"{datetime.fromtimestamp(first):%Y-%m-%d %H:%M}" for first in np.unique(delivered[earlier])}
+    logg_msg = [
+        f"{index + 1} [{values}] first delivered {dates[first]}"
+        for index, values, first in zip(keys.index[earlier], key_values, delivered[earlier])
+    ]
+
+    if mode == "drop":
+        warning = f"Warning: Removed {len(logg_msg)} row(s) delivered in an earlier file, please verify."
+        change_text = "Removed row delivered in an earlier file: "
+    else:
+        warning = f"Warning: {len(logg_msg)} row(s) were delivered in an earlier file, please verify."
+        change_text = "Row delivered in an earlier file: "
+    logg.print_warning(warning)
+    duplicate_index.reported.append(warning)
+
+    logg.log_to_file(
+        heading="EARLIER DELIVERIES",
+        change_text=change_text,
+        data_changes=logg_msg,
+    )
+
+    return earlier
+
+
+def fill_from_security_master(data: pd.DataFrame) -> None:
+    # Blank VERDIPAPIRNAVN and VALUTA are filled from the security master,
+    # each distinct valid ISIN is looked up once
+    columns = [column for column in ("VERDIPAPIRNAVN", "VALUTA") if column in data.columns]
+    codes, uniques = pd.factorize(data["ISIN"])
+    isins = uniques.to_numpy(dtype=object)
+    valid = valid_isin(isins)
+    found = security_master.lookup(list(isins[valid]))
+
+    # Messages are sorted by the position of their row, the index may have gaps
+    logg_msg = []
+    rows = data.index
+    positions = np.arange(len(data))
+    for field, column in enumerate(columns):
+        master_values = np.array([found.get(isin, ("", ""))[field] for isin in isins], dtype=object)[codes]
+        current = as_text(data[column]).to_numpy(dtype=object)
+        blank = as_text(data[column]).str.strip().to_numpy(dtype=object) == ""
+        fill = blank & (master_values != "")
+
+        logg_msg += [
+            (order, f"{row + 1} [ISIN: {isin}] {column} '{old}' -> '{new}'")
+            for order, row, isin, old, new in zip(
+                positions[fill], rows[fill], data.loc[fill, "ISIN"], current[fill], master_values[fill]
+            )
+        ]
+        if column == "VALUTA":
+            differs = ~blank & (master_values != "") & (current != master_values)
+            logg_msg += [
+                (order, f"{row + 1} [ISIN: {isin}] VALUTA '{old}' is '{new}' in the security master, not changed")
+                for order, row, isin, old, new in zip(
+                    positions[differs], rows[differs], data.loc[differs, "ISIN"], current[differs], master_values[differs]
+                )
+            ]
+
+        logg.record_changes(
+            step="fill_from_security_master",
+            rows=rows[fill],
+            column=column,
+            old_values=list(current[fill]),
+            new_values=list(master_values[fill]),
+        )
+        set_values(data, fill, column, master_values[fill])
+
+    unknown = [isin for isin in isins[valid] if isin not in found]
+    if unknown:
+        counts = np.bincount(codes, minlength=len(isins))
+        position = {isin: index for index, isin in enumerate(isins)}
+        logg_msg += [
+            (len(data) + order, f"Not in the security master: {isin} ({counts[position[isin]]} rows)")
+            for order, isin in enumerate(unknown)
+        ]
+
+    logg.log_to_file(
+        heading="SECURITY MASTER",
+        change_text="Security master:",
+        data_changes=[msg for _, msg in sorted(logg_msg, key=lambda item: item[0])],
+    )
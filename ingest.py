@@ -0,0 +1,95 @@
+import codecs
+import re
+import sys
+from typing import BinaryIO
+
+
+UNICODE_MINUS = "−".encode("utf-8")
+# Only whole lines, so a buffer without blank lines is not matched at all
+BLANK_LINES = re.compile(rb"^[ \t\r\f\v]*\n", re.MULTILINE)
+BLANK = b" \t\r\f\v"
+END_LINE = re.compile(rb"^[ \t]*end[ \t\r]*$", re.MULTILINE | re.IGNORECASE)
+
+
+def detect_encoding(buffer: bytes | memoryview, block_size: int = 1 << 20) -> str:
+    # Checked block by block so the whole input is never decoded at once
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    view = memoryview(buffer)
+    try:
+        for start in range(0, len(view), block_size):
+            decoder.decode(view[start : start + block_size])
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return "cp1252"
+
+    return "utf-8-sig"
+
+
+def detect_file_encoding(path: str, block_size: int = 1 << 20) -> str:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as file:
+        try:
+            while block := file.read(block_size):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return "cp1252"
+
+    return "utf-8-sig"
+
+
+def normalize(buffer: bytes, encoding: str) -> bytes:
+    # Same clean up as for pasted input: "−" -> "-", no blank lines, stop at END.
+    # Each step returns the buffer itself when there is nothing to change.
+    end = END_LINE.search(buffer)
+    if end is not None:
+        buffer = buffer[: end.start()]
+    if encoding.startswith("utf-8") and UNICODE_MINUS in buffer:
+        buffer = buffer.replace(UNICODE_MINUS, b"-")
+    if BLANK_LINES.search(buffer) is not None:
+        buffer = BLANK_LINES.sub(b"", buffer)
+    # A last line of only spaces without a line break
+    last_line = buffer.rfind(b"\n") + 1
+    if last_line < len(buffer) and buffer[last_line:].strip(BLANK) == b"":
+        buffer = buffer[:last_line]
+
+    return buffer
+
+
+def read_stream(stream: BinaryIO) -> tuple[bytes, str]:
+    buffer = stream.read()
+    encoding = detect_encoding(buffer)
+
+    return normalize(buffer, encoding), encoding
+
+
+def read_path(path: str) -> tuple[bytes, str]:
+    with open(path, "rb") as file:
+        return read_stream(file)
+
+
+def read_paste() -> tuple[bytes, str]:
+    lines = []
+    while True:
+        try:
+            input_line = input()
+        except EOFError:
+            break
+        if input_line.strip().upper() == "END":
+            break
+        elif input_line.strip() != "":
+            lines.append(input_line.replace("−", "-"))
+
+    lines.append("")
+    return "\n".join(lines).encode("utf-8"), "utf-8"
+
+
+def read_input(path: str | None = None) -> tuple[bytes, str]:
+    # A file path, "-" or piped stdin are read in bulk, otherwise ask for a paste
+    if path == "-" or (path is None and not sys.stdin.isatty()):
+        return read_stream(sys.stdin.buffer)
+    if path is not None:
+        return read_path(path)
+
+    print("Enter input:")
+    return read_paste()
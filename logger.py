@@ -0,0 +1,381 @@
+import atexit
+import gzip
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import StringIO
+import env_data as env
+import math
+import pandas as pd
+from colorama import Fore, Style
+
+
+temp_folder_name = datetime.now().strftime("%Y%m%d_%H%M%S")
+run_warnings: list[str] = []
+# Number of change records made in this process, read by metrics
+changed_cells = 0
+
+# Log entries are written by a background thread through one open file handle
+# per file and run. An entry is (path, text), a path of None closes the files.
+_log_queue: queue.Queue[tuple[str | None, str]] = queue.Queue()
+_log_thread: threading.Thread | None = None
+_log_lock = threading.Lock()
+_encodings: dict[str, str] = {}
+
+# Changes kept in memory until the run is closed, only used for Parquet
+_change_records: list[pd.DataFrame] = []
+
+# Separator used while formatting the output rows, it is not expected in the data
+OUTPUT_PLACEHOLDER = "\x1f"
+ARCHIVE_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+# mkstemp creates files only the owner can read, outputs get the usual permissions.
+# Read once here, os.umask can not be read without setting it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def dump_frames() -> bool:
+    # Set ASK_HELPER_DUMP_FRAMES=0 to leave whole DataFrames out of log.txt
+    return os.environ.get("ASK_HELPER_DUMP_FRAMES", "1") != "0"
+
+
+def change_log_format() -> str:
+    # "jsonl" (default) or "parquet"
+    return os.environ.get("ASK_HELPER_CHANGE_LOG", "jsonl").lower()
+
+
+def _write_log_entries() -> None:
+    # close_log() waits for every entry to be marked done, so an entry that can
+    # not be written is reported and skipped instead of ending the thread
+    files = {}
+    while True:
+        entries = [_log_queue.get()]
+        while True:
+            try:
+                entries.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            for path, text in entries:
+                try:
+                    if path is None:
+                        for file in files.values():
+                            file.close()
+                        files = {}
+                        continue
+
+                    if path not in files:
+                        # Text the encoding has no character for is escaped, not lost
+                        files[path] = open(path, "a", encoding=_encodings.get(path), errors="backslashreplace")
+                    files[path].write(text)
+                except Exception as error:
+                    print(Fore.RED + f"!!! - Could not write to log {path}: {error}" + Style.RESET_ALL)
+
+            for path, file in files.items():
+                try:
+                    file.flush()
+                except Exception as error:
+                    print(Fore.RED + f"!!! - Could not write to log {path}: {error}" + Style.RESET_ALL)
+        finally:
+            for _ in entries:
+                _log_queue.task_done()
+
+
+def _start_log_thread() -> None:
+    global _log_thread
+    with _log_lock:
+        if _log_thread is None:
+            _log_thread = threading.Thread(
+                target=_write_log_entries, name="log-writer", daemon=True
+            )
+            _log_thread.start()
+
+
+def close_log() -> None:
+    # Blocks until everything logged so far is on disk and the files are closed
+    global _change_records
+    if _change_records:
+        changes = pd.concat(_change_records, ignore_index=True)
+        _change_records = []
+        try:
+            changes.to_parquet(f"{env.log_folder}{temp_folder_name}/changes.parquet", index=False)
+        except (OSError, ImportError) as error:
+            print(Fore.RED + f"!!! - Could not write change log: {error}" + Style.RESET_ALL)
+
+    if _log_thread is None:
+        return
+    _log_queue.put((None, ""))
+    _log_queue.join()
+
+
+def _as_strings(values: list | pd.Series) -> list[str]:
+    # to_numpy() reads Arrow backed columns in one go instead of cell by cell
+    if isinstance(values, pd.Series):
+        values = values.to_numpy()
+    return [str(value) for value in values]
+
+
+def record_changes(
+    step: str,
+    rows: pd.Index,
+    column: str,
+    old_values: list | pd.Series,
+    new_values: list | pd.Series | str,
+) -> None:
+    # One record per changed cell, row is numbered as in log.txt
+    global changed_cells
+    if len(rows) == 0:
+        return
+    changed_cells += len(rows)
+
+    changes = pd.DataFrame({"row": [index + 1 for index in rows]})
+    changes.insert(0, "step", step)
+    changes["column"] = column
+    changes["old"] = _as_strings(old_values)
+    if isinstance(new_values, str):
+        changes["new"] = new_values
+    else:
+        changes["new"] = _as_strings(new_values)
+
+    if change_log_format() == "parquet":
+        _change_records.append(changes)
+        return
+
+    path = f"{env.log_folder}{temp_folder_name}/changes.jsonl"
+    _encodings[path] = "utf-8"
+    _start_log_thread()
+    _log_queue.put((path, changes.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n") + "\n"))
+
+
+atexit.register(close_log)
+
+
+def start_run(name: str = "") -> None:
+    global temp_folder_name, run_warnings
+    close_log()
+    temp_folder_name = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if name:
+        temp_folder_name += f"_{name}"
+    run_warnings = []
+
+
+def print_warning(msg: str) -> None:
+    run_warnings.append(msg)
+    print(Fore.RED + "!!! - " + msg + Style.RESET_ALL)
+
+
+def log_to_file(
+    heading: str,
+    data_changes: list[str | pd.DataFrame],
+    change_text: str = "",
+) -> None:
+    padding_size = math.floor((40 - len(heading)) / 2)
+    title = f"#{' '* padding_size}{heading}{' '* (padding_size + len(heading) % 2)}#"
+    heading = f"{'#' * 42}\n#{' ' * 40}#\n{title}\n#{' ' * 40}#\n{'#' * 42}\n"
+
+    text = StringIO()
+    text.write(heading)
+    for change in data_changes:
+        if isinstance(change, pd.DataFrame) and not dump_frames():
+            text.write(f"\n{change_text} [{len(change)} rows x {len(change.columns)} columns, not written]")
+        elif isinstance(change, pd.DataFrame):
+            text.write(f"\n{change_text}")
+            change.to_csv(text, sep=";", index=False)
+        else:
+            text.write(f"\n{change_text} {change}")
+    if len(data_changes) == 0:
+        text.write("\nNo change made")
+    text.write("\n\n\n")
+
+    _start_log_thread()
+    _log_queue.put((f"{env.log_folder}{temp_folder_name}/log.txt", text.getvalue()))
+
+
+def create_folder_file() -> None:
+    global temp_folder_name
+    # Several runs can start within the same second, e.g. in batch mode
+    base_name = temp_folder_name
+    counter = 1
+    while True:
+        try:
+            os.mkdir(f"{env.log_folder}{temp_folder_name}")
+            return
+        except FileExistsError:
+            temp_folder_name = f"{base_name}_{counter}"
+            counter += 1
+
+
+def archive_compression() -> str:
+    # "none" (default), "gzip" or "zstd" for the copy of the output in the log folder
+    compression = os.environ.get("ASK_HELPER_ARCHIVE_COMPRESSION", "none").lower()
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print_warning("zstandard is not installed, the archived output is compressed with gzip")
+            return "gzip"
+
+    return compression
+
+
+def _compress(payload: bytes, compression: str) -> bytes:
+    match compression:
+        case "gzip":
+            return gzip.compress(payload)
+        case "zstd":
+            import zstandard
+
+            return zstandard.ZstdCompressor().compress(payload)
+
+    return payload
+
+
+def _serialize(data: pd.DataFrame, header: bool = True) -> tuple[bytes, bytes]:
+    # The rows are formatted once with a placeholder separator, which is then
+    # replaced by ";" for the archived copy and by tab for the output file
+    text = data.to_csv(sep=OUTPUT_PLACEHOLDER, index=False, decimal=",", header=header)
+    expected = (len(data.columns) - 1) * (len(data) + int(header))
+    if text.count(OUTPUT_PLACEHOLDER) == expected and ";" not in text and "\t" not in text:
+        payload = text.encode("utf-8")
+        del text
+        placeholder = OUTPUT_PLACEHOLDER.encode("utf-8")
+        return payload.replace(placeholder, b";"), payload.replace(placeholder, b"\t")
+
+    # A value holds a separator, so it is quoted differently in the two files
+    return (
+        data.to_csv(sep=";", index=False, decimal=",", header=header).encode("utf-8"),
+        data.to_csv(sep="\t", index=False, decimal=",", header=header).encode("utf-8"),
+    )
+
+
+def _write_output(path: str, payload: bytes, compression: str = "none", append: bool = False) -> None:
+    payload = _compress(payload, compression)
+    if append:
+        # gzip and zstd files can be appended to, each chunk becomes its own frame
+        with open(path, "ab") as file:
+            file.write(payload)
+        return
+
+    # Written to a temporary file next to the target, so the target is never half written
+    folder, name = os.path.split(path)
+    handle, temp_path = tempfile.mkstemp(dir=folder, prefix=f".{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            os.chmod(temp_path, 0o666 & ~_UMASK)
+            file.write(payload)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _write_outputs(
+    data: pd.DataFrame,
+    archive_path: str,
+    output_path: str,
+    compression: str,
+    header: bool = True,
+    append: bool = False,
+) -> None:
+    archive_payload, output_payload = _serialize(data, header=header)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        writes = [
+            pool.submit(_write_output, archive_path, archive_payload, compression, append),
+            pool.submit(_write_output, output_path, output_payload, "none", append),
+        ]
+        for write in writes:
+            write.result()
+
+
+def _archive_name(file_name: str, compression: str) -> str:
+    return f"{file_name}.csv{ARCHIVE_SUFFIXES.get(compression, '')}"
+
+
+def file_name_prefix(data: pd.DataFrame, file_type: str) -> str:
+    # Same name as for a blank MASTERTRANSFERREF when there are no rows left
+    mtr = data.iloc[0, 4] if len(data) else ""
+    return f"{file_type}_{mtr}"
+
+
+def get_file_name(data: pd.DataFrame, file_type: str) -> str:
+    return f"{file_name_prefix(data, file_type)}_{temp_folder_name}"
+
+
+def append_to_output(data: pd.DataFrame, file_name: str, header: bool) -> None:
+    # Streaming writes to hidden part files, finish_output moves them in place
+    archive_path, output_path = _part_paths(file_name)
+    _write_outputs(data, archive_path, output_path, archive_compression(), header=header, append=True)
+
+
+def _part_paths(file_name: str) -> list[str]:
+    return [
+        f"{env.log_folder}{temp_folder_name}/.{_archive_name(file_name, archive_compression())}.part",
+        f"{env.download_folder}.{file_name}.txt.part",
+    ]
+
+
+def discard_output(file_name: str) -> None:
+    # A stream that fails leaves no partial output next to the real files
+    for path in _part_paths(file_name):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _rename_log_folder(file_name: str) -> None:
+    # Later log entries of the run go to the renamed folder
+    global temp_folder_name
+    os.rename(f"{env.log_folder}{temp_folder_name}", f"{env.log_folder}{file_name}")
+    temp_folder_name = file_name
+
+
+def finish_output(file_name: str) -> str:
+    close_log()
+    archive_name = _archive_name(file_name, archive_compression())
+    _rename_log_folder(file_name)
+    archive_part, output_part = _part_paths(file_name)
+    os.replace(archive_part, f"{env.log_folder}{file_name}/{archive_name}")
+    os.replace(output_part, f"{env.download_folder}{file_name}.txt")
+    print(f"File saved to {env.download_folder}{file_name}.txt")
+
+    return f"{env.download_folder}{file_name}.txt"
+
+
+def save_new_file(data: pd.DataFrame, file_type: str) -> str:
+    file_name = get_file_name(data, file_type)
+    compression = archive_compression()
+    close_log()
+    _rename_log_folder(file_name)
+    _write_outputs(
+        data,
+        f"{env.log_folder}{file_name}/{_archive_name(file_name, compression)}",
+        f"{env.download_folder}{file_name}.txt",
+        compression,
+    )
+    print(f"File saved to {env.download_folder}{file_name}.txt")
+
+    return f"{env.download_folder}{file_name}.txt"
+
+
+def save_cached_output(prefix: str, output: bytes, archive: bytes, archive_suffix: str) -> str:
+    # Output of an earlier run with the same input, written as save_new_file does
+    file_name = f"{prefix}_{temp_folder_name}"
+    close_log()
+    _rename_log_folder(file_name)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        writes = [
+            pool.submit(_write_output, f"{env.log_folder}{file_name}/{file_name}{archive_suffix}", archive),
+            pool.submit(_write_output, f"{env.download_folder}{file_name}.txt", output),
+        ]
+        for write in writes:
+            write.result()
+    print(f"File saved to {env.download_folder}{file_name}.txt")
+
+    return f"{env.download_folder}{file_name}.txt"
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+import tracemalloc
+from typing import Any, Callable, TypeVar
+import env_data as env
+import pandas as pd
+import logger as logg
+
+
+T = TypeVar("T")
+
+# step name -> totals over every call of the step in the run
+_steps: dict[str, dict[str, Any]] = {}
+_run: dict[str, Any] = {}
+
+
+def mode() -> str:
+    # "0" (default) off, "1" times and peak memory, "time" only times as
+    # tracemalloc makes the steps several times slower
+    return os.environ.get("ASK_HELPER_METRICS", "0").lower()
+
+
+def enabled() -> bool:
+    return mode() in ("1", "time")
+
+
+def _traced_memory() -> tuple[int, int]:
+    return tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+
+
+def _rows(value: Any) -> int | None:
+    return len(value) if isinstance(value, pd.DataFrame) else None
+
+
+def start() -> None:
+    global _steps, _run
+    _steps = {}
+    _run = {}
+    if not enabled():
+        return
+
+    _run["tracemalloc"] = mode() == "1" and not tracemalloc.is_tracing()
+    if _run["tracemalloc"]:
+        tracemalloc.start()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    _run["wall"] = time.perf_counter()
+    _run["cpu"] = time.process_time()
+    _run["cells"] = logg.changed_cells
+    _run["peak"] = 0
+
+
+def run_step(function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    if not enabled() or not _run:
+        return function(*args, **kwargs)
+
+    frame = kwargs.get("data", next((arg for arg in args if isinstance(arg, pd.DataFrame)), None))
+    rows_in = _rows(frame)
+    cells = logg.changed_cells
+    memory_before = _traced_memory()[0]
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    result = function(*args, **kwargs)
+
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    peak = _traced_memory()[1] - memory_before
+    # reset_peak clears the peak of the whole run, so it is kept here
+    _run["peak"] = max(_run["peak"], _traced_memory()[1])
+    # Steps that change the DataFrame in place are measured on the frame given
+    rows_out = _rows(result) if isinstance(result, pd.DataFrame) else _rows(frame)
+
+    step = _steps.setdefault(
+        function.__name__,
+        {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rows_in": None, "rows_out": None, "cells_changed": 0, "peak_memory_mb": None},
+    )
+    step["calls"] += 1
+    step["wall_seconds"] += wall
+    step["cpu_seconds"] += cpu
+    if rows_in is not None:
+        step["rows_in"] = (step["rows_in"] or 0) + rows_in
+    if rows_out is not None:
+        step["rows_out"] = (step["rows_out"] or 0) + rows_out
+    step["cells_changed"] += logg.changed_cells - cells
+    if tracemalloc.is_tracing():
+        step["peak_memory_mb"] = max(step["peak_memory_mb"] or 0.0, peak / 2**20)
+
+    return result
+
+
+def _format(value: int | float | None, decimals: int = 0) -> str:
+    return "-" if value is None else f"{value:.{decimals}f}"
+
+
+def finish(file_type: str = "", rows: int | None = None, cached: bool = False) -> dict | None:
+    # Summary at the end of log.txt and metrics.json next to it, cached when
+    # the result was taken from the result cache
+    if not enabled() or not _run:
+        return None
+
+    summary = {
+        "file_type": file_type,
+        "rows": rows,
+        "cached": cached,
+        "wall_seconds": time.perf_counter() - _run["wall"],
+        "cpu_seconds": time.process_time() - _run["cpu"],
+        "cells_changed": logg.changed_cells - _run["cells"],
+        "peak_memory_mb": max(_run["peak"], _traced_memory()[1]) / 2**20 if tracemalloc.is_tracing() else None,
+        "steps": [{"step": name, **values} for name, values in _steps.items()],
+    }
+    width = max([len(name) for name in _steps] + [len("total")])
+    lines = [
+        f"{'step'.ljust(width)} {'calls':>5} {'wall (s)':>9} {'cpu (s)':>9} {'rows in':>9} {'rows out':>9} {'changed':>9} {'peak (MB)':>10}"
+    ]
+    for name, values in _steps.items():
+        lines.append(
+            f"{name.ljust(width)} {values['calls']:>5} {values['wall_seconds']:>9.3f} {values['cpu_seconds']:>9.3f}"
+            f" {_format(values['rows_in']):>9} {_format(values['rows_out']):>9}"
+            f" {values['cells_changed']:>9} {_format(values['peak_memory_mb'], 1):>10}"
+        )
+    lines.append(
+        f"{'total'.ljust(width)} {'':>5} {summary['wall_seconds']:>9.3f} {summary['cpu_seconds']:>9.3f}"
+        f" {'':>9} {_format(rows):>9} {summary['cells_changed']:>9} {_format(summary['peak_memory_mb'], 1):>10}"
+    )
+    if tracemalloc.is_tracing():
+        lines.append("Peak memory is what Python and NumPy allocated, memory used by PyArrow is not included.")
+    if cached:
+        lines.append("The result was taken from the result cache, the steps were not run.")
+    if _run["tracemalloc"]:
+        tracemalloc.stop()
+
+    logg.log_to_file(heading="STEP METRICS", data_changes=lines)
+    try:
+        with open(f"{env.log_folder}{logg.temp_folder_name}/metrics.json", "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+    except OSError as error:
+        logg.print_warning(f"Could not write metrics: {error}")
+    logg.close_log()
+
+    return summary
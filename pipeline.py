@@ -0,0 +1,338 @@
+import os
+from dataclasses import dataclass
+from typing import Any, Callable
+import pandas as pd
+import static_data.conversion_data as conversion_data
+import static_data.headers as headers
+import functions as f
+import logger as logg
+import metrics
+import security_master
+import validation
+
+
+MTR_COLUMN = "MASTERTRANSFERREF_(FULLMAKTSNR)"
+
+
+@dataclass(frozen=True)
+class Step:
+    function: Callable[..., Any]
+    # Columns the step looks at and changes, checked against the header when registered
+    reads: tuple[str, ...] = ()
+    writes: tuple[str, ...] = ()
+    # Values from the run passed as keyword arguments, e.g. "file_type"
+    options: tuple[str, ...] = ()
+    # Name the return value is kept under for the later steps and chunks
+    returns: str | None = None
+    # False when the step can not change anything, it is then skipped
+    trigger: Callable[[pd.DataFrame], bool] | None = None
+    skip_reason: str = ""
+    # Steps with a value rule on the same column, next to each other, share one pass
+    rule: f.ValueRule | None = None
+    # Optional steps are left out of the plan unless this returns True
+    enabled: Callable[[], bool] | None = None
+
+    @property
+    def name(self) -> str:
+        return self.function.__name__
+
+
+PIPELINES: dict[str, list[Step]] = {}
+
+
+def register(file_type: str, header: list[str], steps: list[Step]) -> None:
+    for step in steps:
+        unknown = [column for column in step.reads + step.writes if column not in header]
+        if unknown:
+            raise ValueError(f"{file_type} step {step.name} uses unknown column(s): {', '.join(unknown)}")
+
+    PIPELINES[file_type] = steps
+
+
+def _blank(data: pd.DataFrame, column: str) -> pd.Series:
+    return f.as_text(data[column]).str.strip() == ""
+
+
+def has_units(data: pd.DataFrame) -> bool:
+    return bool((data["ANTALL_ANDELER"] != "").any())
+
+
+def has_account_without_nominee(data: pd.DataFrame) -> bool:
+    return bool(
+        (
+            (data["SELG_ALLE_ANDELER"] == "N")
+            & _blank(data, "TIL_KONTO_NOMINEE_TILBYDER")
+            & (data["TIL_ASK_KONTO_KUNDE_TILBYDER"] != "")
+        ).any()
+    )
+
+
+def has_blank_flag(data: pd.DataFrame) -> bool:
+    selg_column = "SELG_ALLE_ANDELER" if "SELG_ALLE_ANDELER" in data.columns else "SELG_ANDELER"
+    return bool((_blank(data, selg_column) | _blank(data, "STOPP_SPAREAVTALE")).any())
+
+
+def has_error_code_g(data: pd.DataFrame) -> bool:
+    return bool((data["FEILKODE"] == "G").any())
+
+
+def has_blank_cost_price(data: pd.DataFrame) -> bool:
+    return bool((data["KOSTPRIS_PR_ISIN"] == "").any())
+
+
+def has_tax_rows(data: pd.DataFrame) -> bool:
+    return bool((data["VERDIPAPIRNAVN"] == "Skatteopplysninger").any())
+
+
+def distributor_steps(file_type: str, header: list[str], convert_columns: list[int]) -> list[Step]:
+    security_columns = tuple(column for column in ("VERDIPAPIRNAVN", "VALUTA") if column in header)
+    return [
+        Step(f.encode_categories, enabled=f.categorical_enabled),
+        Step(
+            f.convert_distributor,
+            reads=tuple(header[col] for col in convert_columns),
+            writes=tuple(header[col] for col in convert_columns),
+            options=("file_type",),
+        ),
+        Step(
+            f.add_distributor,
+            reads=(header[0], header[1], MTR_COLUMN),
+            writes=(header[0], header[1]),
+            options=("file_type", "collect_conflicts"),
+        ),
+        # After the distributors are filled in, so a quarantined row does not
+        # take the only distributor of its MTR with it
+        Step(
+            validation.validate_schema,
+            reads=tuple(validation.SCHEMAS[file_type]),
+            options=("file_type",),
+        ),
+        Step(f.remove_duplicate, reads=tuple(header), writes=tuple(header)),
+        Step(
+            f.remove_earlier_delivered,
+            reads=tuple(conversion_data.duplicate_keys[file_type]),
+            writes=tuple(header),
+            options=("file_type",),
+        ),
+        Step(
+            f.fill_from_security_master,
+            reads=("ISIN",) + security_columns,
+            writes=security_columns,
+            enabled=security_master.enabled,
+        ),
+    ]
+
+
+def value_rule_step(function: Callable[..., Any], rule: f.ValueRule) -> Step:
+    return Step(function, reads=(rule.column, MTR_COLUMN), writes=(rule.column,), rule=rule)
+
+
+def numeric_step(columns: tuple[str, ...]) -> Step:
+    return Step(
+        f.convert_to_numeric,
+        reads=columns,
+        writes=columns,
+        options=("file_type", "separators"),
+        returns="separators",
+    )
+
+
+def group_step(header: list[str], columns: tuple[str, ...]) -> Step:
+    return Step(
+        f.group_same_fund,
+        reads=tuple(header),
+        writes=columns,
+        options=("file_type",),
+        enabled=f.grouping_enabled,
+    )
+
+
+register(
+    "RFH",
+    headers.RFH_header,
+    distributor_steps("RFH", headers.RFH_header, [0, 1])
+    + [value_rule_step(f.pad_customer_number, f.PAD_CUSTOMER_NUMBER)],
+)
+
+register(
+    "RHC",
+    headers.RHC_header,
+    distributor_steps("RHC", headers.RHC_header, [0, 1])
+    + [
+        value_rule_step(f.pad_customer_number, f.PAD_CUSTOMER_NUMBER),
+        Step(f.check_valid_error_code, reads=("FEILKODE",)),
+        Step(
+            f.remove_negative_cash,
+            reads=("VERDI", "FEILKODE", "VERDIPAPIRNAVN"),
+            writes=("VERDI",),
+            trigger=has_error_code_g,
+            skip_reason="no FEILKODE G",
+        ),
+        numeric_step(("ANTALL_ANDELER", "VERDI")),
+        group_step(headers.RHC_header, ("ANTALL_ANDELER", "VERDI")),
+    ],
+)
+
+register(
+    "PTOI",
+    headers.PTOI_header,
+    distributor_steps("PTOI", headers.PTOI_header, [0, 1])
+    + [
+        value_rule_step(f.pad_customer_number, f.PAD_CUSTOMER_NUMBER),
+        Step(
+            f.check_for_units_in_ptoi,
+            reads=("ANTALL_ANDELER", "TRANSFER_REF"),
+            writes=("ANTALL_ANDELER",),
+            trigger=has_units,
+            skip_reason="no units in ANTALL_ANDELER",
+        ),
+        Step(
+            f.move_misplaced_accountno,
+            reads=("VERDIPAPIRNAVN", "MOTTAKENDE_TILBYDER", "SELG_ALLE_ANDELER", "TIL_KONTO_NOMINEE_TILBYDER", "TIL_ASK_KONTO_KUNDE_TILBYDER"),
+            writes=("TIL_KONTO_NOMINEE_TILBYDER", "TIL_ASK_KONTO_KUNDE_TILBYDER"),
+            trigger=has_account_without_nominee,
+            skip_reason="no SELG_ALLE_ANDELER N with an ASK account and no nominee account",
+        ),
+        Step(
+            f.fix_sell_cash,
+            reads=("SELG_ALLE_ANDELER", "STOPP_SPAREAVTALE", "VERDIPAPIRNAVN"),
+            writes=("SELG_ALLE_ANDELER", "STOPP_SPAREAVTALE"),
+            trigger=has_blank_flag,
+            skip_reason="no blank J/N flags",
+        ),
+    ],
+)
+
+register(
+    "PTOC",
+    headers.PTOC_header,
+    distributor_steps("PTOC", headers.PTOC_header, [0, 1])
+    + [
+        value_rule_step(f.pad_customer_number, f.PAD_CUSTOMER_NUMBER),
+        Step(f.check_valid_error_code, reads=("FEILKODE",)),
+        Step(
+            f.set_tax_value_per_isin,
+            reads=("KOSTPRIS_PR_ISIN", "ISIN", "TRANSFER_REF"),
+            writes=("KOSTPRIS_PR_ISIN",),
+            trigger=has_blank_cost_price,
+            skip_reason="no blank KOSTPRIS_PR_ISIN",
+        ),
+        value_rule_step(f.update_tax_indetifier, f.UPDATE_TAX_IDENTIFIER),
+        value_rule_step(f.update_cash_identifier, f.UPDATE_CASH_IDENTIFIER),
+        Step(
+            f.set_tax_and_cash_account,
+            reads=(MTR_COLUMN, "TIL_ASK_KONTO_KUNDE_TILBYDER", "VERDIPAPIRNAVN"),
+            writes=("TIL_ASK_KONTO_KUNDE_TILBYDER",),
+        ),
+        Step(
+            f.move_tax_data,
+            reads=("VERDIPAPIRNAVN", "KOSTPRIS_PR_ISIN", "FLYTTET_KOSTPRIS_ASK"),
+            writes=("KOSTPRIS_PR_ISIN", "FLYTTET_KOSTPRIS_ASK"),
+            trigger=has_tax_rows,
+            skip_reason="no Skatteopplysninger rows",
+        ),
+        Step(
+            f.fix_sell_cash,
+            reads=("SELG_ANDELER", "STOPP_SPAREAVTALE", "VERDIPAPIRNAVN"),
+            writes=("SELG_ANDELER", "STOPP_SPAREAVTALE"),
+            trigger=has_blank_flag,
+            skip_reason="no blank J/N flags",
+        ),
+        numeric_step(
+            (
+                "ANTALL_FLYTTET",
+                "KOSTPRIS_PR_ISIN",
+                "FLYTTET_KONTANTER",
+                "FLYTTET_KOSTPRIS_ASK",
+                "MINSTE_INNSKUDD_HIA",
+                "UBENYTTET_SKJERMING_31.12",
+                "BENYTTET_SKJERMING_HIA",
+            )
+        ),
+        group_step(
+            headers.PTOC_header,
+            (
+                "ANTALL_FLYTTET",
+                "KOSTPRIS_PR_ISIN",
+                "FLYTTET_KOSTPRIS_ASK",
+                "MINSTE_INNSKUDD_HIA",
+                "UBENYTTET_SKJERMING_31.12",
+                "BENYTTET_SKJERMING_HIA",
+            )
+        ),
+    ],
+)
+
+register(
+    "NTO",
+    headers.NTO_header,
+    distributor_steps("NTO", headers.NTO_header, [1, 4]) + [numeric_step(("ANTALL_ANDELER",))],
+)
+
+
+def plan(file_type: str) -> list[list[Step]]:
+    # Steps in order, value rules on the same column next to each other are grouped
+    groups: list[list[Step]] = []
+    for step in PIPELINES[file_type]:
+        if step.enabled is not None and not step.enabled():
+            continue
+        previous = groups[-1][-1] if groups else None
+        if (
+            step.rule is not None
+            and previous is not None
+            and previous.rule is not None
+            and previous.rule.column == step.rule.column
+        ):
+            groups[-1].append(step)
+        else:
+            groups.append([step])
+
+    return groups
+
+
+def _fused(steps: list[Step]) -> Callable[..., None]:
+    def run_rules(data: pd.DataFrame) -> None:
+        f.apply_value_rules(data, [step.rule for step in steps])
+
+    run_rules.__name__ = "+".join(step.name for step in steps)
+    return run_rules
+
+
+def run(
+    data: pd.DataFrame,
+    file_type: str,
+    separators: dict[str, str | None] | None = None,
+) -> dict[str, str | None]:
+    if file_type not in PIPELINES:
+        raise Exception(f"No pipeline registered for file type {file_type}")
+
+    context = {
+        "file_type": file_type,
+        "collect_conflicts": os.environ.get("ASK_HELPER_COLLECT_CONFLICTS", "0") == "1",
+        "separators": separators,
+    }
+    skipped = []
+    for group in plan(file_type):
+        if len(group) > 1:
+            metrics.run_step(_fused(group), data=data)
+            continue
+
+        step = group[0]
+        if step.trigger is not None and not step.trigger(data):
+            skipped.append(f"{step.name}: {step.skip_reason}")
+            continue
+
+        result = metrics.run_step(
+            step.function, data=data, **{option: context[option] for option in step.options}
+        )
+        if step.returns:
+            context[step.returns] = result
+
+    if skipped:
+        logg.log_to_file(
+            heading="SKIPPED STEPS",
+            change_text="Nothing to change for",
+            data_changes=skipped,
+        )
+
+    return context["separators"] or {}
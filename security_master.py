@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import pandas as pd
+import env_data as env
+
+
+# Names the columns of the security master file may have, the first found is used
+COLUMNS = {
+    "isin": ["ISIN"],
+    "name": ["VERDIPAPIRNAVN", "NAME", "NAVN"],
+    "currency": ["VALUTA", "CURRENCY"],
+}
+# SQLite allows 999 parameters in a query on older versions
+BATCH_SIZE = 900
+
+# ISIN -> (name, currency) or None when not in the master, kept for the life
+# of the process as long as the master file is the same
+_found: dict[str, tuple[str, str] | None] = {}
+_found_version = ""
+
+
+def master_path() -> str:
+    # CSV file with ISIN, VERDIPAPIRNAVN and VALUTA, no lookup when not set
+    return os.environ.get("ASK_HELPER_SECURITY_MASTER", "")
+
+
+def enabled() -> bool:
+    return master_path() != ""
+
+
+def database_path() -> str:
+    return f"{env.log_folder}.security_master.sqlite"
+
+
+def version() -> str:
+    # Changes when the master file is changed, part of the result cache key
+    path = master_path()
+    if not path:
+        return ""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _read_master(path: str, chunk_size: int = 100_000):
+    with open(path, encoding="utf-8-sig") as file:
+        header = file.readline()
+    separator = max([";", "\t", ","], key=header.count)
+
+    names = {column.strip().upper(): column for column in header.rstrip("\r\n").split(separator)}
+    columns = {}
+    for key, candidates in COLUMNS.items():
+        found = next((names[name] for name in candidates if name in names), None)
+        if found is None and key == "isin":
+            raise Exception(f"The security master {path} has no ISIN column")
+        columns[key] = found
+
+    used = [column for column in columns.values() if column is not None]
+    for chunk in pd.read_csv(
+        path,
+        sep=separator,
+        dtype=str,
+        usecols=used,
+        keep_default_na=False,
+        encoding="utf-8-sig",
+        chunksize=chunk_size,
+    ):
+        blank = pd.Series("", index=chunk.index)
+        isin = chunk[columns["isin"]].str.strip().str.upper()
+        name = chunk[columns["name"]].str.strip() if columns["name"] else blank
+        currency = chunk[columns["currency"]].str.strip().str.upper() if columns["currency"] else blank
+        yield list(zip(isin, name, currency))
+
+
+def _connect() -> sqlite3.Connection:
+    # The master file is imported into an indexed table once, and again only
+    # when the file changes, so a lookup does not depend on the size of the file
+    os.makedirs(env.log_folder, exist_ok=True)
+    connection = sqlite3.connect(database_path(), timeout=60)
+    connection.execute("CREATE TABLE IF NOT EXISTS source (version TEXT)")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS securities (isin TEXT PRIMARY KEY, name TEXT, currency TEXT) WITHOUT ROWID"
+    )
+
+    current = version()
+    if _imported(connection) != current:
+        # Another process may be importing the same file, the lock is taken first
+        connection.execute("BEGIN IMMEDIATE")
+        if _imported(connection) != current:
+            connection.execute("DELETE FROM securities")
+            for rows in _read_master(master_path()):
+                connection.executemany("INSERT OR REPLACE INTO securities VALUES (?, ?, ?)", rows)
+            connection.execute("DELETE FROM source")
+            connection.execute("INSERT INTO source VALUES (?)", (current,))
+        connection.commit()
+
+    return connection
+
+
+def _imported(connection: sqlite3.Connection) -> str | None:
+    row = connection.execute("SELECT version FROM source").fetchone()
+    return row[0] if row else None
+
+
+def lookup(isins: list[str]) -> dict[str, tuple[str, str]]:
+    # Name and currency of the ISINs found in the master
+    global _found_version
+    if _found_version != version():
+        _found.clear()
+        _found_version = version()
+
+    connection = _connect()
+    try:
+        missing = [isin for isin in isins if isin not in _found]
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = missing[start : start + BATCH_SIZE]
+            rows = connection.execute(
+                f"SELECT isin, name, currency FROM securities WHERE isin IN ({', '.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            found = {isin: (name, currency) for isin, name, currency in rows}
+            for isin in batch:
+                _found[isin] = found.get(isin)
+    finally:
+        connection.close()
+
+    return {isin: _found[isin] for isin in isins if _found[isin] is not None}
@@ -116,3 +116,13 @@ NTO_distributors = {
 }
 
 tax_key = ["skattedata", "skatedata", "kateopplysninger", "Skatteopplysninger (Utbytte angis pr.  ISIN)", "skattASK"]
+
+# Columns that identify a line across files, a line with the same values in a
+# later file from the partner is reported as delivered before
+duplicate_keys = {
+    "RFH": ["MASTERTRANSFERREF_(FULLMAKTSNR)", "ASK_KONTO", "ISIN", "VERDIPAPIRNAVN"],
+    "RHC": ["MASTERTRANSFERREF_(FULLMAKTSNR)", "FRA_KONTO_KUNDE", "ISIN", "VERDIPAPIRNAVN"],
+    "PTOI": ["TRANSFER_REF"],
+    "PTOC": ["TRANSFER_REF"],
+    "NTO": ["TRANSFER_REF"],
+}
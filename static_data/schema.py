@@ -0,0 +1,35 @@
+# Rules for the values of a column, used for every file type with that column.
+# "allowed": the only values accepted, "pattern": a regular expression the
+# whole value must match, "numeric": an amount as convert_to_numeric reads it,
+# "isin": an ISIN with a correct check digit or one of "placeholders",
+# "stop": a value breaking the rule can not be processed, so it stops the run
+# also when only warning.
+# Blank values are accepted unless "allowed" says otherwise, leading and
+# trailing spaces are not looked at.
+
+ERROR_CODES = ["A", "B", "C", "D", "E", "F", "G", "H", ""]
+FLAGS = ["J", "N", ""]
+# Given by partners in the ISIN column of rows without a security, e.g. cash
+PLACEHOLDER_ISINS = ["NO0000000000"]
+
+column_rules = {
+    "FEILKODE": {"allowed": ERROR_CODES, "stop": True},
+    "SELG_ALLE_ANDELER": {"allowed": FLAGS},
+    "SELG_ANDELER": {"allowed": FLAGS},
+    "STOPP_SPAREAVTALE": {"allowed": FLAGS},
+    "SPAREAVTALE_STOPPET": {"allowed": FLAGS},
+    "KUNDE_LEGITIMERT": {"allowed": FLAGS},
+    "BEHOLDNING_SPERRET": {"allowed": FLAGS},
+    "ISIN": {"isin": True, "placeholders": PLACEHOLDER_ISINS},
+    "VALUTA": {"pattern": r"[A-Z]{3}"},
+    "KUNDENR": {"pattern": r"\d{1,11}"},
+    "ANTALL_ANDELER": {"numeric": True},
+    "VERDI": {"numeric": True},
+    "ANTALL_FLYTTET": {"numeric": True},
+    "KOSTPRIS_PR_ISIN": {"numeric": True},
+    "FLYTTET_KONTANTER": {"numeric": True},
+    "FLYTTET_KOSTPRIS_ASK": {"numeric": True},
+    "MINSTE_INNSKUDD_HIA": {"numeric": True},
+    "UBENYTTET_SKJERMING_31.12": {"numeric": True},
+    "BENYTTET_SKJERMING_HIA": {"numeric": True},
+}
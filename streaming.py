@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+from typing import Iterator
+import ask_helper
+import duplicate_index
+import functions as f
+import ingest
+import logger as logg
+import metrics
+
+
+MTR_COLUMN = "MASTERTRANSFERREF_(FULLMAKTSNR)"
+
+
+def read_sample(path: str, encoding: str, size: int = 1 << 16) -> str:
+    with open(path, encoding=encoding) as file:
+        sample = file.read(size)
+
+    lines = [line for line in sample.splitlines() if line.strip() != ""]
+    return "\n".join(lines) + "\n"
+
+
+def align_to_mtr(chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    # Hold back the rows of the last MTR in a chunk until the next chunk, so all
+    # rows of a MTR are processed together. Rows of a MTR are expected to be
+    # next to each other, as they are in the ASK files.
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pd.concat([pending, chunk])
+
+        mtr = chunk[MTR_COLUMN].to_numpy()
+        other_mtr = np.flatnonzero(mtr != mtr[-1]) if len(mtr) else []
+        if len(other_mtr) == 0:
+            pending = chunk
+            continue
+
+        split = other_mtr[-1] + 1
+        yield chunk.iloc[:split]
+        pending = chunk.iloc[split:]
+
+    if pending is not None and len(pending):
+        yield pending
+
+
+def read_chunks(
+    path: str, chunk_size: int, debug: bool = False
+) -> tuple[str, Iterator[pd.DataFrame]]:
+    encoding = ingest.detect_file_encoding(path)
+    separator = metrics.run_step(f.get_separator, read_sample(path, encoding), debug=debug)
+
+    reader = pd.read_csv(
+        path,
+        sep=separator,
+        dtype=f.string_dtype(),
+        encoding=encoding,
+        chunksize=chunk_size,
+    )
+
+    first_chunk = next(reader).dropna(how="all")
+    empty_columns = [
+        col
+        for col in first_chunk.columns
+        if first_chunk[col].isna().all() and "Unnamed" in col
+    ]
+    first_chunk = first_chunk.drop(columns=empty_columns).fillna("")
+    first_chunk = first_chunk.replace("−", "-", regex=True)
+
+    file_type = metrics.run_step(f.indentify_file_type, first_chunk, debug=debug)
+    metrics.run_step(f.update_header, data=first_chunk, file_type=file_type)
+    header = first_chunk.columns
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        yield first_chunk
+        for chunk in reader:
+            chunk = chunk.dropna(how="all").drop(columns=empty_columns).fillna("")
+            chunk = chunk.replace("−", "-", regex=True)
+            chunk.columns = header
+            yield chunk
+
+    return file_type, align_to_mtr(chunks())
+
+
+def process_file_streaming(
+    path: str, chunk_size: int = 100_000, debug: bool = False
+) -> dict:
+    logg.create_folder_file()
+    metrics.start()
+    duplicate_index.start()
+
+    logg.log_to_file(
+        heading="STREAMING INPUT",
+        data_changes=[f"Reading {path} in chunks of {chunk_size} rows"],
+    )
+
+    file_type, chunks = read_chunks(path, chunk_size, debug=debug)
+
+    file_name = None
+    separators = {}
+    rows = 0
+    last_chunk = None
+    try:
+        for chunk in chunks:
+            chunk = chunk.copy()
+            separators = ask_helper.clean_data(chunk, file_type=file_type, separators=separators)
+            last_chunk = chunk
+            if chunk.empty:
+                continue
+
+            if file_name is None:
+                file_name = logg.get_file_name(chunk, file_type)
+            metrics.run_step(logg.append_to_output, chunk, file_name, header=rows == 0)
+            rows += len(chunk)
+
+            if debug:
+                print(f"Processed {rows} rows")
+
+        if last_chunk is None:
+            raise Exception("No rows left to save after processing the file")
+        if file_name is None:
+            # Nothing left after cleaning, the output only gets the header as in save_new_file
+            file_name = logg.get_file_name(last_chunk, file_type)
+            logg.append_to_output(last_chunk, file_name, header=True)
+
+        output_path = metrics.run_step(logg.finish_output, file_name)
+    except BaseException:
+        if file_name is not None:
+            logg.discard_output(file_name)
+        raise
+
+    duplicate_index.commit()
+    metrics.finish(file_type=file_type, rows=rows)
+
+    return {
+        "file_type": file_type,
+        "rows": rows,
+        "output": output_path,
+        "warnings": list(logg.run_warnings),
+    }
@@ -0,0 +1,36 @@
+import os
+import sys
+import types
+import pytest
+
+# env_data.py is made by each user (see README), the tests use temporary folders
+try:
+    import env_data
+except ImportError:
+    env_data = types.ModuleType("env_data")
+    sys.modules["env_data"] = env_data
+
+import logger as logg
+
+
+@pytest.fixture(autouse=True)
+def folders(tmp_path, monkeypatch):
+    monkeypatch.setattr(env_data, "download_folder", f"{tmp_path}/download/", raising=False)
+    monkeypatch.setattr(env_data, "log_folder", f"{tmp_path}/log/", raising=False)
+    os.makedirs(env_data.download_folder)
+    os.makedirs(env_data.log_folder)
+    # Settings of the user running the tests would change the results
+    for name in list(os.environ):
+        if name.startswith("ASK_HELPER_"):
+            monkeypatch.delenv(name)
+    # A new run for each test as batch.py starts one for each file
+    logg.start_run()
+    yield tmp_path
+    logg.close_log()
+
+
+@pytest.fixture
+def run(folders):
+    # A run folder for log.txt and the change log
+    logg.create_folder_file()
+    return f"{env_data.log_folder}{logg.temp_folder_name}/"
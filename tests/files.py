@@ -0,0 +1,29 @@
+import static_data.headers as headers
+
+
+# Small RHC files written row by row, for the cases the generator does not make
+def rhc_file(rows: list[dict[str, str]]) -> str:
+    lines = [";".join(headers.RHC_header)]
+    for row in rows:
+        lines.append(";".join(row.get(column, "") for column in headers.RHC_header))
+    return "\n".join(lines) + "\n"
+
+
+def rhc_row(**values: str) -> dict[str, str]:
+    row = {
+        "MOTTAKENDE_PART_(TILBYDER)": "HGSB",
+        "AVLEVERENDE_PART": "ParetoAM",
+        "KUNDENR": "23410886939",
+        "NAVN": "Ola Haugen",
+        "MASTERTRANSFERREF_(FULLMAKTSNR)": "MTR000000001",
+        "FRA_KONTO_KUNDE": "15030412126",
+        "ISIN": "NO4479924422",
+        "VALUTA": "NOK",
+        "VERDIPAPIRNAVN": "DNB Indeks D",
+        "ANTALL_ANDELER": "12,5",
+        "VERDI": "1000,00",
+        "KUNDE_LEGITIMERT": "N",
+        "BEHOLDNING_SPERRET": "N",
+    }
+    row.update(values)
+    return row
@@ -0,0 +1,92 @@
+import json
+import os
+import ask_helper
+import cache
+from static_data import conversion_data
+from benchmarks import generate
+
+DATA = b"VERDIPAPIRNAVN;ISIN\nDNB Indeks D;NO4479924422\n"
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_key_changes_with_the_input_and_settings(tmp_path, monkeypatch):
+    key = cache.input_key(DATA, "utf-8")
+
+    assert cache.input_key(DATA, "utf-8") == key
+    assert cache.input_key(DATA + b"\n", "utf-8") != key
+    assert cache.input_key(DATA, "latin-1") != key
+
+    monkeypatch.setenv("ASK_HELPER_VALIDATION", "quarantine")
+    assert cache.input_key(DATA, "utf-8") != key
+    monkeypatch.delenv("ASK_HELPER_VALIDATION")
+
+    # Settings not changing the output are not part of the key
+    monkeypatch.setenv("ASK_HELPER_CACHE_SIZE_MB", "1")
+    assert cache.input_key(DATA, "utf-8") == key
+
+
+def test_key_changes_with_the_security_master(tmp_path, monkeypatch):
+    master = tmp_path / "master.csv"
+    master.write_text("ISIN;NAME;CURRENCY\nNO4479924422;DNB Indeks D;NOK\n", encoding="utf-8")
+    monkeypatch.setenv("ASK_HELPER_SECURITY_MASTER", str(master))
+    key = cache.input_key(DATA, "utf-8")
+
+    master.write_text("ISIN;NAME;CURRENCY\nNO4479924422;DNB Indeks A;NOK\n", encoding="utf-8")
+    os.utime(master, ns=(1, 1))
+
+    assert cache.input_key(DATA, "utf-8") != key
+
+
+def test_static_data_version_follows_the_tables(monkeypatch):
+    version = cache._static_data_version()
+    assert version == cache.STATIC_DATA_VERSION
+
+    monkeypatch.setattr(conversion_data, "test_table", {"a": "b"}, raising=False)
+    assert cache._static_data_version() != version
+
+
+def test_identical_input_is_taken_from_the_cache(tmp_path):
+    path = generate.write_file(str(tmp_path / "ptoc.csv"), "PTOC", 200, seed=2)
+
+    first = ask_helper.process_data(read(path), source=path)
+    second = ask_helper.process_data(read(path), source=path)
+
+    assert not first.get("cached")
+    assert second.get("cached")
+    assert second["rows"] == first["rows"]
+    assert second["output"] != first["output"]
+    assert read(second["output"]) == read(first["output"])
+
+
+def test_cache_off(tmp_path, monkeypatch):
+    monkeypatch.setenv("ASK_HELPER_CACHE", "0")
+    path = generate.write_file(str(tmp_path / "nto.csv"), "NTO", 100)
+
+    ask_helper.process_data(read(path), source=path)
+    second = ask_helper.process_data(read(path), source=path)
+
+    assert not second.get("cached")
+    assert not os.path.exists(cache.cache_folder())
+
+
+def test_evict_least_recently_used(tmp_path, monkeypatch):
+    keys = []
+    for number in range(3):
+        path = generate.write_file(str(tmp_path / f"nto{number}.csv"), "NTO", 100, seed=number)
+        keys.append(cache.input_key(read(path), "utf-8"))
+        ask_helper.process_data(read(path), source=path)
+
+    # The first result was used last
+    for age, key in zip([3, 1, 2], keys):
+        os.utime(f"{cache.cache_folder()}{key}/meta.json", (age, age))
+    with open(f"{cache.cache_folder()}{keys[0]}/meta.json", encoding="utf-8") as file:
+        size = json.load(file)["size"]
+    monkeypatch.setenv("ASK_HELPER_CACHE_SIZE_MB", str(size / 2**20))
+
+    cache.evict()
+
+    assert [name for name in os.listdir(cache.cache_folder()) if not name.startswith(".")] == [keys[0]]
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+import distributor_index
+from distributor_index import DistributorIndex, normalize_name
+
+TABLE = {
+    "Pareto Asset Management": "PAM",
+    "Søderberg og Partners": "SP",
+    "Søderberg  og partners": "SP2",
+}
+
+
+@pytest.mark.parametrize(
+    "name, normalized",
+    [
+        ("  Pareto   Asset\tManagement ", "pareto asset management"),
+        ("SÃ¸derberg og Partners", "søderberg og partners"),
+        ("ＰＡＭ", "pam"),
+        ("", ""),
+    ],
+)
+def test_normalize_name(name, normalized):
+    assert normalize_name(name) == normalized
+
+
+def test_first_name_of_a_normalized_key_is_kept():
+    index = DistributorIndex(TABLE)
+
+    assert index.lookup["søderberg og partners"] == "SP"
+    assert index.names["søderberg og partners"] == "Søderberg og Partners"
+
+
+def test_convert_keeps_the_column_dtype():
+    index = DistributorIndex(TABLE)
+    values = pd.Series(["pareto asset management", "Unknown AS", "SÃ¸derberg og Partners"], dtype="string")
+
+    converted = index.convert(values)
+
+    assert converted.dtype == values.dtype
+    assert converted.tolist()[0::2] == ["PAM", "SP"]
+    assert pd.isna(converted[1])
+
+
+def test_is_known_and_suggest():
+    index = DistributorIndex(TABLE)
+
+    assert index.is_known("PAM")
+    assert index.is_known(" ")
+    assert not index.is_known("Pareto Asset Managment")
+    assert index.suggest("Pareto Asset Managment") == ("Pareto Asset Management", "PAM")
+    assert index.suggest("Nordnet") is None
+
+
+def test_tables_are_indexed_once():
+    assert distributor_index.distributors.suggest("Sparebank1 Nord Norge")[1] == "SB1SNN"
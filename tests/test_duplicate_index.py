@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+import ask_helper
+import duplicate_index
+from benchmarks import generate
+
+
+@pytest.fixture
+def rhc_file(tmp_path):
+    return generate.write_file(str(tmp_path / "rhc.csv"), "RHC", 200, seed=1)
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_lines_are_found_once_committed():
+    data = pd.DataFrame({"TRANSFER_REF": ["TR1", "TR2", ""]})
+    hashes, has_key = duplicate_index.fingerprints(data, "PTOC")
+    assert has_key.tolist() == [True, True, False]
+
+    duplicate_index.start()
+    assert not duplicate_index.delivered_before("PTOC", hashes).any()
+    duplicate_index.add("PTOC", hashes[has_key])
+    duplicate_index.commit()
+
+    duplicate_index.start()
+    assert (duplicate_index.delivered_before("PTOC", hashes) > 0).tolist() == [True, True, False]
+
+
+def test_expired_lines_are_forgotten(monkeypatch):
+    hashes, _ = duplicate_index.fingerprints(pd.DataFrame({"TRANSFER_REF": ["TR1"]}), "PTOC")
+    duplicate_index.start()
+    duplicate_index.add("PTOC", hashes)
+    duplicate_index.commit()
+
+    monkeypatch.setenv("ASK_HELPER_DUPLICATE_RETENTION_DAYS", "-1")
+    duplicate_index.start()
+    assert duplicate_index.delivered_before("PTOC", hashes).tolist() == [0]
+
+
+def test_resent_file_is_flagged_with_the_cache_on(rhc_file):
+    first = ask_helper.process_data(read(rhc_file), source=rhc_file)
+    second = ask_helper.process_data(read(rhc_file), source=rhc_file)
+
+    assert not first.get("cached")
+    assert second.get("cached")
+    assert not any("earlier file" in warning for warning in first["warnings"])
+    assert f"Warning: {first['rows']} row(s) were delivered in an earlier file, please verify." in second["warnings"]
+    assert read(first["output"]) == read(second["output"])
+
+    # The lines of the first run are in the index once
+    records = np.fromfile(duplicate_index.index_path("RHC"), dtype=duplicate_index.RECORD)
+    assert len(records) == len(np.unique(records["fingerprint"]))
+
+
+def test_drop_mode_does_not_use_the_cache(rhc_file, monkeypatch):
+    monkeypatch.setenv("ASK_HELPER_CROSS_FILE_DUPLICATES", "drop")
+
+    first = ask_helper.process_data(read(rhc_file), source=rhc_file)
+    second = ask_helper.process_data(read(rhc_file), source=rhc_file)
+
+    assert not second.get("cached")
+    assert first["rows"] > 0
+    assert second["rows"] == 0
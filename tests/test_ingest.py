@@ -0,0 +1,24 @@
+import ingest
+
+
+def test_normalize_returns_clean_input_itself():
+    buffer = b"A;B\n1;2\n3;4\n"
+
+    assert ingest.normalize(buffer, "utf-8-sig") is buffer
+
+
+def test_normalize_pasted_input():
+    buffer = "A;B\n \t\n1;−2\r\n\n3;4\nEND\n5;6\n".encode("utf-8")
+
+    assert ingest.normalize(buffer, "utf-8-sig") == b"A;B\n1;-2\r\n3;4\n"
+
+
+def test_normalize_last_line_of_spaces():
+    assert ingest.normalize(b"A;B\n1;2\n   ", "utf-8-sig") == b"A;B\n1;2\n"
+
+
+def test_unicode_minus_only_replaced_in_utf8():
+    # The same bytes are other characters in cp1252
+    buffer = "1;−2\n".encode("utf-8")
+
+    assert ingest.normalize(buffer, "cp1252") is buffer
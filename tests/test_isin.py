@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import ask_helper
+import env_data as env
+import functions as f
+import logger as logg
+import validation
+from benchmarks import generate
+from tests.files import rhc_file, rhc_row
+
+
+def test_valid_isin():
+    values = np.array(
+        ["NO4479924422", "US0378331005", "SE5489770488", "US0378331006", "NO447992442", "no4479924422", "", None],
+        dtype=object,
+    )
+
+    assert f.valid_isin(values).tolist() == [True, True, True, False, False, False, False, False]
+
+
+def test_check_digit_of_generated_isins():
+    bodies = [f"NO{number:09d}" for number in range(0, 10**9, 7_777_777)]
+    isins = np.array([body + generate.isin_check_digit(body) for body in bodies], dtype=object)
+
+    assert f.valid_isin(isins).all()
+
+
+def test_placeholder_isin_is_not_a_schema_error():
+    data = pd.DataFrame({"ISIN": ["NO0000000000", "", "NO4479924422", "NO4479924423"]})
+
+    assert not f.valid_isin(np.array(["NO0000000000"], dtype=object))[0]
+    assert validation.validate(data, "RHC")["row"].tolist() == [4]
+
+
+@pytest.mark.parametrize("mode", ["warn", "quarantine"])
+def test_placeholder_and_cash_rows_are_kept(mode, monkeypatch):
+    monkeypatch.setenv("ASK_HELPER_VALIDATION", mode)
+    monkeypatch.setenv("ASK_HELPER_CACHE", "0")
+    text = rhc_file(
+        [
+            rhc_row(),
+            rhc_row(ISIN="NO0000000000", VERDIPAPIRNAVN="Cash", ANTALL_ANDELER="", VERDI="100,00"),
+            rhc_row(ISIN="", VERDIPAPIRNAVN="Cash", ANTALL_ANDELER="", VERDI="200,00"),
+        ]
+    )
+
+    result = ask_helper.process_data(text)
+
+    assert result["rows"] == 3
+    assert not any("schema" in warning for warning in result["warnings"])
+    assert not os.path.exists(f"{env.log_folder}{logg.temp_folder_name}/quarantine.csv")
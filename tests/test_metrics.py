@@ -0,0 +1,29 @@
+import json
+import ask_helper
+import env_data as env
+import logger as logg
+from benchmarks import generate
+
+
+def read_metrics() -> dict:
+    with open(f"{env.log_folder}{logg.temp_folder_name}/metrics.json", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def test_metrics_are_written_for_a_cached_result(tmp_path, monkeypatch):
+    monkeypatch.setenv("ASK_HELPER_METRICS", "time")
+    path = generate.write_file(str(tmp_path / "nto.csv"), "NTO", 100)
+    with open(path, "rb") as file:
+        data = file.read()
+
+    first = ask_helper.process_data(data, source=path)
+    assert read_metrics()["cached"] is False
+
+    second = ask_helper.process_data(data, source=path)
+    metrics = read_metrics()
+
+    assert second.get("cached")
+    assert metrics["cached"] is True
+    assert metrics["rows"] == first["rows"]
+    assert metrics["file_type"] == "NTO"
+    assert [step["step"] for step in metrics["steps"]] == ["load"]
@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+import functions as f
+import logger as logg
+
+# Non-breaking spaces as thousands separators and the Unicode minus sign
+AMOUNTS = {
+    "ANTALL_ANDELER": ["1\u00a0234,50", "1\u202f000,25", "\u221212,5", "", "abc"],
+    "VERDI": ["2\u00a0000,00", " 3\u202f500,75\u00a0", "\u22121\u00a0000,00", "0,5", "7"],
+}
+
+
+def rhc_frame(string_dtype: str) -> pd.DataFrame:
+    dtype = pd.StringDtype("pyarrow") if string_dtype == "pyarrow" else object
+    return pd.DataFrame({column: pd.Series(values, dtype=dtype) for column, values in AMOUNTS.items()})
+
+
+@pytest.mark.parametrize("string_dtype", ["object", "pyarrow"])
+def test_parse_numeric_non_breaking_spaces(string_dtype):
+    values = rhc_frame(string_dtype)["ANTALL_ANDELER"]
+
+    numeric, failed = f.parse_numeric(values, ",")
+
+    assert numeric.tolist()[:4] == [1234.5, 1000.25, -12.5, 0.0]
+    assert failed.tolist() == [False, False, False, False, True]
+
+
+def test_convert_to_numeric_same_for_both_string_dtypes(run):
+    results = {}
+    for string_dtype in ["object", "pyarrow"]:
+        data = rhc_frame(string_dtype)
+        separators = f.convert_to_numeric(data, "RHC")
+        results[string_dtype] = (data, separators)
+
+    pd.testing.assert_frame_equal(results["object"][0], results["pyarrow"][0])
+    assert results["object"][1] == results["pyarrow"][1] == {"ANTALL_ANDELER": ",", "VERDI": ","}
+    assert results["pyarrow"][0]["VERDI"].tolist() == [2000.0, 3500.75, -1000.0, 0.5, 7.0]
+
+
+def test_detect_decimal_separator_by_majority():
+    assert f.detect_decimal_separator(pd.Series(["1.234,5", "12,5", "1,234.5", ""])) == ","
+    assert f.detect_decimal_separator(pd.Series(["1,234.5", "0.5", "7"])) == "."
+    assert f.detect_decimal_separator(pd.Series(["7", "", "1 000"])) is None
+
+
+@pytest.mark.parametrize(
+    "decimal, values",
+    [(",", ["1.234.567,89", "-0,5", "1 000"]), (".", ["1,234,567.89", "-0.5", "1 000"])],
+)
+def test_parse_numeric_thousands_separators(decimal, values):
+    numeric, failed = f.parse_numeric(pd.Series(values), decimal)
+
+    assert numeric.tolist() == [1234567.89, -0.5, 1000.0]
+    assert not failed.any()
+
+
+def test_convert_to_numeric_detects_each_column(run):
+    data = pd.DataFrame(
+        {"ANTALL_ANDELER": ["1.234,5", "12,5", "x1"], "VERDI": ["1,234.5", "0.25", ""]},
+        index=[0, 4, 9],
+    )
+
+    separators = f.convert_to_numeric(data, "RHC")
+    logg.close_log()
+    with open(f"{run}log.txt", encoding="utf-8") as file:
+        log = file.read()
+
+    assert separators == {"ANTALL_ANDELER": ",", "VERDI": "."}
+    assert data["ANTALL_ANDELER"].tolist()[:2] == [1234.5, 12.5]
+    assert pd.isna(data.loc[9, "ANTALL_ANDELER"])
+    assert data["VERDI"].tolist() == [1234.5, 0.25, 0.0]
+    assert "NUMERIC CONVERSION FAILED" in log
+    assert "10 [ANTALL_ANDELER] 'x1'" in log
+
+
+def test_convert_to_numeric_uses_known_separators(run):
+    data = pd.DataFrame({"ANTALL_ANDELER": ["1,5", "2,5"], "VERDI": ["1.000", "2.000"]})
+
+    separators = f.convert_to_numeric(data, "RHC", {"VERDI": ","})
+
+    assert separators == {"ANTALL_ANDELER": ",", "VERDI": ","}
+    assert data["VERDI"].tolist() == [1000.0, 2000.0]
@@ -0,0 +1,51 @@
+import glob
+import os
+import pytest
+import ask_helper
+import env_data as env
+import logger as logg
+import streaming
+from benchmarks import generate
+
+
+def hidden_files() -> list[str]:
+    return glob.glob(f"{env.download_folder}**/.*", recursive=True) + glob.glob(
+        f"{env.log_folder}*/.*", recursive=True
+    )
+
+
+def test_failed_write_leaves_no_temporary_file(folders, monkeypatch):
+    path = f"{env.download_folder}output.txt"
+    with open(path, "wb") as file:
+        file.write(b"earlier")
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        logg._write_output(path, b"new")
+
+    assert os.listdir(env.download_folder) == ["output.txt"]
+    with open(path, "rb") as file:
+        assert file.read() == b"earlier"
+
+
+def test_failed_stream_leaves_no_part_files(tmp_path, monkeypatch):
+    path = generate.write_file(str(tmp_path / "ptoc.csv"), "PTOC", 300)
+    clean_data = ask_helper.clean_data
+    calls = []
+
+    def fail_on_second_chunk(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise ValueError("bad chunk")
+        return clean_data(*args, **kwargs)
+
+    monkeypatch.setattr(ask_helper, "clean_data", fail_on_second_chunk)
+    with pytest.raises(ValueError):
+        streaming.process_file_streaming(path, chunk_size=100)
+
+    assert len(calls) == 2
+    assert hidden_files() == []
+    assert os.listdir(env.download_folder) == []
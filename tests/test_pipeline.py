@@ -0,0 +1,54 @@
+import pandas as pd
+import env_data as env
+import functions as f
+import logger as logg
+import pipeline
+import static_data.headers as headers
+
+
+def test_value_rules_on_the_same_column_share_a_group():
+    groups = [[step.name for step in group] for group in pipeline.plan("PTOC")]
+
+    assert ["update_tax_indetifier", "update_cash_identifier"] in groups
+    assert all(len(group) == 1 for group in groups if "update_tax_indetifier" not in group)
+
+
+def test_registered_steps_use_known_columns():
+    for file_type, steps in pipeline.PIPELINES.items():
+        header = getattr(headers, f"{file_type}_header")
+        for step in steps:
+            assert set(step.reads + step.writes) <= set(header), step.name
+
+
+def ptoc_names() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "VERDIPAPIRNAVN": ["skattedata", " cash NOK", "DNB Indeks D", "Cash", "SKATTEDATA"],
+            pipeline.MTR_COLUMN: [f"MTR{number}" for number in range(5)],
+        }
+    )
+
+
+def read_log(run_folder: str) -> str:
+    logg.close_log()
+    with open(f"{run_folder}log.txt", encoding="utf-8") as file:
+        return file.read()
+
+
+def test_fused_rules_same_as_one_by_one(run):
+    fused = ptoc_names()
+    group = next(group for group in pipeline.plan("PTOC") if len(group) > 1)
+    pipeline._fused(group)(fused)
+    fused_log = read_log(run)
+
+    logg.start_run()
+    logg.create_folder_file()
+    separate = ptoc_names()
+    f.update_tax_indetifier(separate)
+    f.update_cash_identifier(separate)
+    separate_log = read_log(f"{env.log_folder}{logg.temp_folder_name}/")
+
+    pd.testing.assert_frame_equal(fused, separate)
+    assert fused["VERDIPAPIRNAVN"].tolist() == ["Skatteopplysninger", "Cash", "DNB Indeks D", "Cash", "Skatteopplysninger"]
+    assert "UPDATE CASH IDENTIFIER" in fused_log
+    assert fused_log.split("\n", 1)[1] == separate_log.split("\n", 1)[1]
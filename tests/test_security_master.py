@@ -0,0 +1,63 @@
+import os
+import pandas as pd
+import pytest
+import functions as f
+import logger as logg
+import security_master
+
+KNOWN = "NO4479924422"
+OTHER_CURRENCY = "SE5489770488"
+UNKNOWN = "US0378331005"
+
+
+@pytest.fixture
+def master(tmp_path, monkeypatch):
+    path = tmp_path / "master.csv"
+    path.write_text(
+        "ISIN;NAME;CURRENCY\n"
+        f"{KNOWN};DNB Indeks D;NOK\n"
+        f"{OTHER_CURRENCY};Handelsbanken Indeks A;SEK\n",
+        encoding="utf-8",
+    )
+    monkeypatch.setenv("ASK_HELPER_SECURITY_MASTER", str(path))
+    return path
+
+
+def read_log(run_folder: str) -> list[str]:
+    logg.close_log()
+    with open(f"{run_folder}log.txt", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.startswith("Security master:")]
+
+
+def test_lookup_imports_again_when_the_file_changes(master):
+    assert security_master.lookup([KNOWN, UNKNOWN]) == {KNOWN: ("DNB Indeks D", "NOK")}
+
+    master.write_text(f"ISIN;VERDIPAPIRNAVN;VALUTA\n{UNKNOWN};Apple;USD\n", encoding="utf-8")
+    os.utime(master, ns=(1, 1))
+
+    assert security_master.lookup([KNOWN, UNKNOWN]) == {UNKNOWN: ("Apple", "USD")}
+
+
+def test_fill_in_row_order_with_gaps_in_the_index(master, run):
+    # Rows dropped by earlier steps leave gaps, here labels 50 and 70 are
+    # larger than the number of rows
+    data = pd.DataFrame(
+        {
+            "ISIN": [UNKNOWN, OTHER_CURRENCY, KNOWN, "NO0000000000"],
+            "VALUTA": ["USD", "NOK", "", ""],
+            "VERDIPAPIRNAVN": ["Apple", "", "", "Cash"],
+        },
+        index=[70, 1, 50, 3],
+    )
+
+    f.fill_from_security_master(data)
+
+    assert data["VERDIPAPIRNAVN"].tolist() == ["Apple", "Handelsbanken Indeks A", "DNB Indeks D", "Cash"]
+    assert data["VALUTA"].tolist() == ["USD", "NOK", "NOK", ""]
+    assert read_log(run) == [
+        f"Security master: 2 [ISIN: {OTHER_CURRENCY}] VERDIPAPIRNAVN '' -> 'Handelsbanken Indeks A'",
+        f"Security master: 2 [ISIN: {OTHER_CURRENCY}] VALUTA 'NOK' is 'SEK' in the security master, not changed",
+        f"Security master: 51 [ISIN: {KNOWN}] VERDIPAPIRNAVN '' -> 'DNB Indeks D'",
+        f"Security master: 51 [ISIN: {KNOWN}] VALUTA '' -> 'NOK'",
+        f"Security master: Not in the security master: {UNKNOWN} (1 rows)",
+    ]
@@ -0,0 +1,51 @@
+import os
+import pandas as pd
+import pytest
+import ask_helper
+import env_data as env
+import logger as logg
+import validation
+from tests.files import rhc_file, rhc_row
+
+NBSP = "\u00a0"
+NARROW_NBSP = "\u202f"
+
+
+def nbsp_file() -> str:
+    return rhc_file(
+        [
+            rhc_row(ANTALL_ANDELER=f"1{NBSP}234,50", VERDI=f"2{NBSP}000,00"),
+            rhc_row(
+                ISIN="SE5489770488",
+                ANTALL_ANDELER=f"1{NARROW_NBSP}000,25",
+                VERDI=f"{NARROW_NBSP}3{NARROW_NBSP}500,75{NBSP}",
+            ),
+        ]
+    )
+
+
+@pytest.mark.parametrize("string_dtype", ["object", "pyarrow"])
+def test_non_breaking_spaces_are_valid_amounts(string_dtype):
+    data = pd.read_csv(
+        pd.io.common.StringIO(nbsp_file()),
+        sep=";",
+        dtype=str if string_dtype == "object" else pd.StringDtype("pyarrow"),
+        keep_default_na=False,
+    )
+
+    assert validation.validate(data, "RHC").empty
+
+
+@pytest.mark.parametrize("mode", ["warn", "abort", "quarantine"])
+def test_non_breaking_spaces_in_every_mode(mode, monkeypatch):
+    monkeypatch.setenv("ASK_HELPER_VALIDATION", mode)
+    monkeypatch.setenv("ASK_HELPER_CACHE", "0")
+
+    result = ask_helper.process_data(nbsp_file())
+
+    assert result["rows"] == 2
+    assert not any("schema" in warning for warning in result["warnings"])
+    output = pd.read_csv(result["output"], sep="\t", dtype=str, keep_default_na=False)
+    assert output["ANTALL_ANDELER"].tolist() == ["1234,5", "1000,25"]
+    assert output["VERDI"].tolist() == ["2000,0", "3500,75"]
+    assert not os.path.exists(f"{env.log_folder}{logg.temp_folder_name}/quarantine.csv")
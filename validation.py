@@ -0,0 +1,153 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+import env_data as env
+import static_data.headers as headers
+import static_data.schema as schema
+import functions as f
+import logger as logg
+
+
+HEADERS = {
+    "RFH": headers.RFH_header,
+    "RHC": headers.RHC_header,
+    "PTOI": headers.PTOI_header,
+    "PTOC": headers.PTOC_header,
+    "NTO": headers.NTO_header,
+}
+ERROR_COLUMNS = ["row", "column", "value", "rule"]
+
+
+def mode() -> str:
+    # "warn" (default) logs the errors and goes on, "abort" stops the run and
+    # "quarantine" moves the rows with errors to quarantine.csv in the log folder
+    return os.environ.get("ASK_HELPER_VALIDATION", "warn").lower()
+
+
+def build_schema(header: list[str]) -> dict[str, dict]:
+    return {column: schema.column_rules[column] for column in header if column in schema.column_rules}
+
+
+SCHEMAS = {file_type: build_schema(header) for file_type, header in HEADERS.items()}
+
+
+def _decimal_separator(text: pd.Series, counts: np.ndarray) -> str:
+    # As detect_decimal_separator, the separator appearing last in a value,
+    # counted per row from the distinct values
+    comma_last = text.str.contains(r",[^.]*$").to_numpy(dtype=bool)
+    period_last = text.str.contains(r"\.[^,]*$").to_numpy(dtype=bool)
+    return "," if counts[comma_last].sum() > counts[period_last].sum() else "."
+
+
+def _invalid(text: pd.Series, counts: np.ndarray, rule: dict) -> tuple[np.ndarray, str]:
+    # text holds the distinct values of a column, stripped, counts how often each is found
+    if "allowed" in rule:
+        invalid = ~text.isin(rule["allowed"])
+        return invalid.to_numpy(dtype=bool), f"not one of {', '.join(repr(value) for value in rule['allowed'])}"
+
+    blank = text == ""
+    if "isin" in rule:
+        accepted = blank | text.isin(rule.get("placeholders", []))
+        invalid = ~f.valid_isin(text.to_numpy(dtype=object)) & ~accepted.to_numpy(dtype=bool)
+        return invalid, "not a valid ISIN (format or check digit)"
+
+    if "pattern" in rule:
+        invalid = ~text.str.fullmatch(rule["pattern"]) & ~blank
+        return invalid.to_numpy(dtype=bool), f"does not match {rule['pattern']}"
+
+    # The amounts convert_to_numeric can read: spaces and thousands separators
+    # anywhere, a sign, digits and one decimal separator
+    decimal = _decimal_separator(text, counts)
+    thousands = "." if decimal == "," else ","
+    skip = rf"[{f.NUMBER_SPACES}{re.escape(thousands)}]*"
+    digits = rf"(?:\d{skip})"
+    number = rf"{skip}[-−+]?{skip}(?:{digits}+(?:{re.escape(decimal)}{skip}{digits}*)?|{re.escape(decimal)}{skip}{digits}+)"
+    invalid = ~text.str.fullmatch(number) & ~text.str.fullmatch(skip)
+    return invalid.to_numpy(dtype=bool), "not a number"
+
+
+def validate(data: pd.DataFrame, file_type: str) -> pd.DataFrame:
+    # One row per value breaking a rule, ordered by row and column
+    errors = []
+    for position, (column, rule) in enumerate(SCHEMAS[file_type].items()):
+        if column not in data.columns:
+            continue
+        # Each distinct value is checked once, as Arrow strings so the regular
+        # expressions run in C++ instead of Python
+        codes, uniques = pd.factorize(data[column])
+        values = uniques.to_numpy(dtype=object)
+        text = pd.Series(values, dtype=pd.StringDtype("pyarrow")).str.strip()
+        invalid, message = _invalid(text, np.bincount(codes, minlength=len(values)), rule)
+        mask = invalid[codes]
+        if not mask.any():
+            continue
+        errors.append(
+            pd.DataFrame(
+                {
+                    "row": data.index[mask] + 1,
+                    "column": column,
+                    "value": values[codes[mask]],
+                    "rule": message,
+                    "position": position,
+                }
+            )
+        )
+
+    if not errors:
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+
+    table = pd.concat(errors, ignore_index=True).sort_values(["row", "position"], kind="stable")
+    return table[ERROR_COLUMNS].reset_index(drop=True)
+
+
+def _stop(errors: pd.DataFrame, file_type: str) -> None:
+    first = errors.iloc[0]
+    raise Exception(
+        f"{len(errors)} value(s) do not match the {file_type} schema, first on row {first['row']} [{first['column']}] '{first['value']}' {first['rule']}"
+    )
+
+
+def validate_schema(data: pd.DataFrame, file_type: str) -> None:
+    errors = validate(data, file_type)
+    if errors.empty:
+        return
+
+    logg.log_to_file(
+        heading="SCHEMA VALIDATION",
+        change_text="Invalid value on row:",
+        data_changes=[
+            f"{row} [{column}] '{value}' {rule}"
+            for row, column, value, rule in errors.itertuples(index=False)
+        ],
+    )
+
+    rows = pd.Index(errors["row"].unique() - 1)
+    current_mode = mode()
+    if current_mode == "abort":
+        _stop(errors, file_type)
+    # Values that can not be processed stop the run also when only warning,
+    # with the same message as abort
+    stopping = errors[[schema.column_rules[column].get("stop", False) for column in errors["column"]]]
+    if current_mode != "quarantine" and not stopping.empty:
+        _stop(stopping, file_type)
+
+    if current_mode == "quarantine":
+        quarantined = data.loc[rows]
+        path = f"{env.log_folder}{logg.temp_folder_name}/quarantine.csv"
+        quarantined.to_csv(path, sep=";", index=False, mode="a", header=not os.path.exists(path))
+        logg.record_changes(
+            step="validate_schema",
+            rows=rows,
+            column="",
+            old_values=[", ".join(str(value) for value in row) for row in quarantined.itertuples(index=False)],
+            new_values="row quarantined",
+        )
+        data.drop(index=rows, inplace=True)
+        logg.print_warning(
+            f"Warning: {len(rows)} row(s) with {len(errors)} invalid value(s) moved to quarantine.csv, see SCHEMA VALIDATION in log.txt"
+        )
+    else:
+        logg.print_warning(
+            f"Warning: {len(errors)} value(s) in {len(rows)} row(s) do not match the {file_type} schema, see SCHEMA VALIDATION in log.txt"
+        )
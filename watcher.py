@@ -0,0 +1,275 @@
+import argparse
+import ctypes
+import json
+import os
+import re
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+import env_data as env
+import batch
+import logger as logg
+
+
+# Output files of ask_helper, e.g. PTOC_MTR000001_20240101_120000_PTOC.txt
+OWN_OUTPUT = re.compile(r"^(RFH|RHC|PTOI|PTOC|NTO)_.*_\d{8}_\d{6}.*\.txt$")
+# Downloads that are still in progress
+PARTIAL_SUFFIXES = (".crdownload", ".part", ".partial", ".download", ".tmp")
+
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+
+
+def open_inotify(folder: str) -> int | None:
+    # inotify through libc, None where it is not available
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        handle = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if handle < 0:
+            return None
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(handle, os.fsencode(folder), mask) < 0:
+            os.close(handle)
+            return None
+    except (OSError, AttributeError):
+        return None
+
+    return handle
+
+
+def _ignore_interrupt() -> None:
+    # Ctrl+C reaches the workers too, the main process lets them finish instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def is_candidate(name: str) -> bool:
+    return not (
+        name.startswith(".")
+        or name.lower().endswith(PARTIAL_SUFFIXES)
+        or OWN_OUTPUT.match(name)
+    )
+
+
+def move_to(path: str, folder: str) -> str:
+    os.makedirs(folder, exist_ok=True)
+    stem, extension = os.path.splitext(os.path.basename(path))
+    target = os.path.join(folder, stem + extension)
+    counter = 1
+    while os.path.exists(target):
+        target = os.path.join(folder, f"{stem}_{counter}{extension}")
+        counter += 1
+    shutil.move(path, target)
+
+    return target
+
+
+class Watcher:
+    def __init__(
+        self,
+        inbox: str,
+        workers: int = 2,
+        interval: float = 2.0,
+        settle: float = 2.0,
+        status_path: str | None = None,
+    ) -> None:
+        self.inbox = inbox
+        self.processed_folder = os.path.join(inbox, "processed")
+        self.failed_folder = os.path.join(inbox, "failed")
+        self.workers = workers
+        self.interval = interval
+        self.settle = settle
+        self.status_path = status_path or f"{env.log_folder}watcher_status.json"
+
+        # path -> ((size, mtime), first seen with that size and mtime)
+        self.settling: dict[str, tuple[tuple[int, int], float]] = {}
+        self.queue: deque[str] = deque()
+        self.running: dict[Future, str] = {}
+        self.recent: deque[dict] = deque(maxlen=20)
+        self.processed = 0
+        self.failed = 0
+        self.rows = 0
+        self.started = time.time()
+        self.inbox_mtime = None
+
+        self.inotify = open_inotify(inbox)
+        # Finished jobs wake up the main loop through this socket pair
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_ignore_interrupt)
+
+    def known(self, path: str) -> bool:
+        return path in self.settling or path in self.queue or path in self.running.values()
+
+    def scan(self) -> None:
+        # Without inotify the folder is only listed when its mtime has changed
+        inbox_mtime = os.stat(self.inbox).st_mtime_ns
+        if self.inotify is None and inbox_mtime == self.inbox_mtime and not self.settling:
+            return
+        self.inbox_mtime = inbox_mtime
+
+        now = time.monotonic()
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                if not entry.is_file() or not is_candidate(entry.name):
+                    continue
+                if not self.known(entry.path):
+                    self.settling[entry.path] = ((-1, -1), now)
+
+        # A file is ready when its size and mtime have not changed for a while
+        for path, (signature, since) in list(self.settling.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.settling[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != signature:
+                self.settling[path] = (current, now)
+            elif now - since >= self.settle and stat.st_size > 0:
+                del self.settling[path]
+                self.queue.append(path)
+
+    def submit(self) -> None:
+        while self.queue and len(self.running) < self.workers:
+            path = self.queue.popleft()
+            future = self.pool.submit(batch.process_file, path)
+            future.add_done_callback(lambda _: self.wake_writer.send(b"x"))
+            self.running[future] = path
+
+    def collect(self) -> None:
+        for future in [future for future in self.running if future.done()]:
+            path = self.running.pop(future)
+            try:
+                result = future.result()
+            except Exception as error:
+                result = {"file": path, "rows": 0, "output": "", "warnings": [], "error": f"{type(error).__name__}: {error}", "elapsed": 0.0}
+
+            if result["error"]:
+                self.failed += 1
+                moved = move_to(path, self.failed_folder)
+                logg.print_warning(f"{os.path.basename(path)} failed: {result['error']}")
+            else:
+                self.processed += 1
+                self.rows += result["rows"]
+                moved = move_to(path, self.processed_folder)
+                print(f"{os.path.basename(path)} -> {result['output']}")
+
+            self.recent.appendleft(
+                {
+                    "file": os.path.basename(path),
+                    "moved_to": moved,
+                    "file_type": result.get("file_type", ""),
+                    "rows": result["rows"],
+                    "output": result["output"],
+                    "warnings": len(result["warnings"]),
+                    "error": result["error"],
+                    "seconds": round(result["elapsed"], 3),
+                    "finished": datetime.now().isoformat(timespec="seconds"),
+                }
+            )
+
+    def write_status(self) -> None:
+        uptime = time.time() - self.started
+        status = {
+            "inbox": self.inbox,
+            "mode": "inotify" if self.inotify is not None else "polling",
+            "workers": self.workers,
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "settling": len(self.settling),
+            "queued": len(self.queue),
+            "running": len(self.running),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rows": self.rows,
+            "files_per_minute": round((self.processed + self.failed) / uptime * 60, 2) if uptime else 0.0,
+            "recent": list(self.recent),
+        }
+
+        folder, name = os.path.split(self.status_path)
+        handle, temp_path = tempfile.mkstemp(dir=folder or ".", prefix=f".{name}.", suffix=".tmp")
+        with os.fdopen(handle, "w", encoding="utf-8") as file:
+            json.dump(status, file, indent=2)
+        os.replace(temp_path, self.status_path)
+
+    def wait(self) -> None:
+        # Files that are settling are checked again after the interval,
+        # otherwise sleep until inotify, a finished job or the interval
+        sources = [self.wake_reader] + ([self.inotify] if self.inotify is not None else [])
+        readable, _, _ = select.select(sources, [], [], self.interval)
+        if self.wake_reader in readable:
+            self.wake_reader.recv(4096)
+        if self.inotify is not None and self.inotify in readable:
+            try:
+                while os.read(self.inotify, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def idle(self) -> bool:
+        return not (self.settling or self.queue or self.running)
+
+    def run(self, once: bool = False) -> None:
+        print(f"Watching {self.inbox} ({'inotify' if self.inotify is not None else 'polling'}, {self.workers} worker(s))")
+        try:
+            while True:
+                self.scan()
+                self.collect()
+                self.submit()
+                self.write_status()
+                if once and self.idle():
+                    break
+                self.wait()
+        except KeyboardInterrupt:
+            print("Stopping, waiting for running files")
+            self.queue.clear()
+        finally:
+            self.pool.shutdown(wait=True)
+            self.collect()
+            self.write_status()
+            if self.inotify is not None:
+                os.close(self.inotify)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Watch a folder and clean every partner file that is saved to it."
+    )
+    parser.add_argument(
+        "--inbox",
+        default=env.download_folder,
+        help=f"folder to watch, processed and failed files are moved to sub folders (default: {env.download_folder})",
+    )
+    parser.add_argument("-w", "--workers", type=int, default=2, help="files processed at the same time (default: 2)")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between checks of the folder (default: 2)")
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=2.0,
+        help="seconds a file must stay unchanged before it is processed (default: 2)",
+    )
+    parser.add_argument("--status", default=None, help="status file (default: watcher_status.json in log_folder)")
+    parser.add_argument("--once", action="store_true", help="process the files in the folder and stop")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    Watcher(
+        args.inbox,
+        workers=args.workers,
+        interval=args.interval,
+        settle=args.settle,
+        status_path=args.status,
+    ).run(once=args.once)